@@ -0,0 +1,152 @@
+"""
+Batch mode of MERCHANT'S GUIDE TO THE GALAXY: many working directories,
+each with its own input.txt, are processed by a pool of worker processes
+in one run. Every directory gets its own output.txt and errors.txt, as
+written by main.main; a failure of one directory (e.g. contradicting
+prices, which stop main with SystemExit) does not stop the others.
+Results of all the jobs are collected into an aggregate summary.
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from main import main
+
+# Result of one job: status is "ok" or "failed"; message explains failure.
+JobResult = namedtuple("JobResult", ["workdir", "status", "seconds",
+                                     "message"])
+
+
+def expand_workdirs(patterns):
+    """Returns sorted list of directories matching the patterns
+    (directory names or glob patterns) which contain input.txt."""
+
+    workdirs = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            if os.path.isfile(os.path.join(path, "input.txt")):
+                workdirs.add(path)
+    return(sorted(workdirs))
+
+
+def run_job(workdir, **main_kwargs):
+    """Process one working directory by main; returns JobResult.
+    Exceptions and SystemExit of main are reported as failures."""
+
+    start = time.perf_counter()
+    try:
+        main(workdir, **main_kwargs)
+    except SystemExit as err:  # contradiction in the input
+        return(JobResult(workdir, "failed", time.perf_counter() - start,
+                         str(err)))
+    except Exception as err:
+        return(JobResult(workdir, "failed", time.perf_counter() - start,
+                         "{0}: {1}".format(type(err).__name__, err)))
+    return(JobResult(workdir, "ok", time.perf_counter() - start, ""))
+
+
+def _run_pool(job, workdirs, workers):
+    """Process the working directories by a new pool of worker processes.
+    Returns list of JobResult, with BrokenProcessPool exception instead
+    for the jobs not finished because a worker process died."""
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(job, x) for x in workdirs]
+        for (workdir, future) in zip(workdirs, futures):
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as err:
+                results.append(err)
+            except Exception as err:
+                results.append(JobResult(workdir, "failed", 0.0,
+                                         "{0}: {1}".format(
+                                             type(err).__name__, err)))
+    return(results)
+
+
+def run_batch(workdirs, workers=None, **main_kwargs):
+    """Process the working directories by pool of worker processes
+    (workers=None: one per CPU core; workers=1: in this process).
+    Keyword arguments are passed to main. Returns list of JobResult
+    in the order of workdirs."""
+
+    job = partial(run_job, **main_kwargs)
+    if workers == 1:
+        return([job(x) for x in workdirs])
+
+    results = _run_pool(job, workdirs, workers)
+    # A dead worker process breaks the whole pool, failing all its
+    # unfinished jobs; they are rerun one per pool, so that only
+    # the job killing its worker fails:
+    for (index, result) in enumerate(results):
+        if isinstance(result, BrokenProcessPool):
+            result = _run_pool(job, [workdirs[index]], 1)[0]
+        if isinstance(result, BrokenProcessPool):
+            result = JobResult(workdirs[index], "failed", 0.0,
+                               "{0}: {1}".format(type(result).__name__,
+                                                 result))
+        results[index] = result
+    return(results)
+
+
+def summarize(results, seconds=None):
+    """Returns aggregate summary of the job results as dictionary;
+    seconds is wall time of the whole batch."""
+
+    failures = [x for x in results if x.status != "ok"]
+    return({"jobs": len(results),
+            "ok": len(results) - len(failures),
+            "failed": len(failures),
+            "job_seconds": sum(x.seconds for x in results),
+            "seconds": seconds,
+            "failures": [{"workdir": x.workdir, "message": x.message}
+                         for x in failures]})
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(
+        description="Merchant's guide to the galaxy: batch mode")
+    parser.add_argument("workdirs", nargs="+",
+                        help="directories containing input.txt, or glob "
+                             "patterns of them (e.g. 'ledgers/*')")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="number of worker processes "
+                             "(0: one per CPU core; default: 0)")
+    parser.add_argument("--catalog", default=None,
+                        help="compiled catalog file (relative to workdir) "
+                             "caching dictionary and prices between runs")
+    parser.add_argument("--answer-cache", type=int, default=65536,
+                        help="size of LRU cache of answers to repeated "
+                             "queries (0: no cache; default: 65536)")
+    parser.add_argument("--summary", default=None,
+                        help="write JSON summary of the batch to the file")
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    """ The batch is started from the command line """
+    args = parse_args()
+    start = time.perf_counter()
+    results = run_batch(expand_workdirs(args.workdirs),
+                        workers=args.workers or None, catalog=args.catalog,
+                        answer_cache_size=args.answer_cache)
+    summary = summarize(results, time.perf_counter() - start)
+    print("jobs: {0}, ok: {1}, failed: {2}, time: {3:.3f} s".format(
+        summary["jobs"], summary["ok"], summary["failed"],
+        summary["seconds"]))
+    for failure in summary["failures"]:
+        print("FAILED {0}: {1}".format(failure["workdir"],
+                                       failure["message"]))
+    if args.summary is not None:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
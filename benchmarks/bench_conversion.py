@@ -0,0 +1,75 @@
+"""
+Microbenchmark of Intergalactic -> integer conversion:
+reference intergalactic_to_int vs IntergalacticConverter
+(precomputed Roman numeral table + per-dictionary cache)
+and vectorized intergalactic_to_int_batch (if numpy is installed).
+Run from the package directory: python benchmarks/bench_conversion.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+# make main.py importable when the script is run from any directory:
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from main import (IntergalacticConverter, intergalactic_to_int,  # noqa: E402
+                  intergalactic_to_int_batch, int_to_roman, _load_numpy)
+
+sample_dict = {"glob": "i", "prok": "v", "pish": "x", "tegj": "l",
+               "blin": "c", "mott": "d", "gaa": "m"}
+
+
+def make_numbers(count, seed=0):
+    """Returns list of random valid Intergalactic numbers."""
+
+    roman_intergal_dict = {v: k for (k, v) in sample_dict.items()}
+    rnd = random.Random(seed)
+    return([[roman_intergal_dict[x]
+             for x in int_to_roman(rnd.randint(1, 3999))]
+            for _ in range(count)])
+
+
+def main(count=100000, repeat=5):
+    """Print time per conversion for both conversion paths."""
+
+    numbers = make_numbers(count)
+
+    def reference():
+        for number in numbers:
+            intergalactic_to_int(number, sample_dict)
+
+    def engine_cold():
+        converter = IntergalacticConverter(sample_dict)
+        for number in numbers:
+            converter.to_int(number)
+
+    converter = IntergalacticConverter(sample_dict)
+
+    def engine_warm():
+        for number in numbers:
+            converter.to_int(number)
+
+    def batch():
+        intergalactic_to_int_batch(numbers, sample_dict)
+
+    cases = [("intergalactic_to_int", reference),
+             ("converter (cold cache)", engine_cold),
+             ("converter (warm cache)", engine_warm)]
+    if _load_numpy() is not None:  # numpy is imported lazily by main
+        cases.append(("batch (numpy)", batch))
+
+    results = {}
+    for (name, func) in cases:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        results[name] = best
+        print("{0:<24} {1:8.3f} us/number".format(name, best / count * 1e6))
+
+    print("speedup (warm cache): {0:.1f}x".format(
+        results["intergalactic_to_int"] / results["converter (warm cache)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Throughput of run_queries_parallel vs number of worker processes.
+Run from the package directory:
+python benchmarks/bench_parallel.py [number of queries] [chunk size]
+"""
+
+import os
+import random
+import sys
+import time
+
+# make main.py importable when the script is run from any directory:
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from main import int_to_roman, run_queries, run_queries_parallel  # noqa
+
+sample_dict = {"glob": "i", "prok": "v", "pish": "x", "tegj": "l",
+               "blin": "c", "mott": "d", "gaa": "m"}
+sample_prices = {"silver": 17.0, "gold": 14450.0, "iron": 195.5}
+
+
+def make_queries(count, seed=0):
+    """Returns list of random number conversion and price queries."""
+
+    roman_intergal_dict = {v: k for (k, v) in sample_dict.items()}
+    goods = sorted(sample_prices)
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        number = [roman_intergal_dict[x]
+                  for x in int_to_roman(rnd.randint(1, 3999))]
+        if rnd.random() < 0.5:
+            queries.append(["how", "much", "is"] + number + ["?"])
+        else:
+            queries.append(["how", "many", "credits", "is"] + number +
+                           [rnd.choice(goods), "?"])
+    return(queries)
+
+
+def main(count=400000, chunk_size=20000):
+    """Print throughput of serial and parallel query execution."""
+
+    queries = make_queries(count)
+
+    start = time.perf_counter()
+    serial_out = run_queries(queries, sample_dict, sample_prices)
+    serial_time = time.perf_counter() - start
+    print("{0:<10} {1:12.0f} queries/s".format("serial",
+                                              count / serial_time))
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        out = run_queries_parallel(queries, sample_dict, sample_prices,
+                                   workers=workers, chunk_size=chunk_size)
+        elapsed = time.perf_counter() - start
+        assert out == serial_out
+        print("{0:<10} {1:12.0f} queries/s  speedup {2:.2f}x".format(
+            "{0} worker".format(workers), count / elapsed,
+            serial_time / elapsed))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,155 @@
+"""
+Benchmark of the stages of main.main at several input sizes: wall time
+and peak traced memory of every stage, written as JSON for comparison
+of runs. Inputs are produced by generate_workload.py.
+Run from the package directory:
+python benchmarks/bench_stages.py --sizes 10000 100000 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# make main.py importable when the script is run from any directory:
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from generate_workload import write_workload  # noqa: E402
+
+
+def run_stages(workdir):
+    """Run the stages of main.main one by one. Yields tuples
+    (stage name, number of input items, function running the stage);
+    each function returns the output of the stage."""
+
+    state = {}
+
+    def classify():
+        state["records"] = main.classify_records(main.iter_input(workdir))
+        return(state["records"])
+
+    def validate_dict():
+        dict_records, price_records, query_records, rejected = \
+            state["records"]
+        state["dict_records"], state["rejected"] = \
+            main.validate_dict_records(dict_records, rejected)
+        return(state["dict_records"])
+
+    def create_dict():
+        state["intergal_roman_dict"] = main.create_dict_from_records(
+            state["dict_records"])
+        state["converter"] = main.IntergalacticConverter(
+            state["intergal_roman_dict"])
+        return(state["intergal_roman_dict"])
+
+    def validate_price():
+        state["price_records"], state["rejected"] = \
+            main.validate_price_records(state["records"][1],
+                                        state["rejected"],
+                                        state["converter"])
+        return(state["price_records"])
+
+    def calculate_prices():
+        state["goods_prices"] = main.calculate_prices_from_records(
+            state["price_records"], state["converter"])
+        return(state["goods_prices"])
+
+    def run_queries():
+        state["out_txt"] = main.run_queries(
+            state["records"][2], state["intergal_roman_dict"],
+            state["goods_prices"], state["converter"],
+            main.AnswerCache())
+        return(state["out_txt"])
+
+    def write_out():
+        main.write_lines(workdir, "output.txt", state["out_txt"])
+        main.write_lines(workdir, "errors.txt",
+                         main.chain(map(main.format_rejected,
+                                        state["rejected"]), ["\n"]))
+        return(state["out_txt"])
+
+    yield("classify_records", classify)
+    yield("validate_dict_records", validate_dict)
+    yield("create_dict_from_records", create_dict)
+    yield("validate_price_records", validate_price)
+    yield("calculate_prices_from_records", calculate_prices)
+    yield("run_queries", run_queries)
+    yield("write_out", write_out)
+
+
+def count_items(output):
+    """Returns number of items produced by the stage."""
+
+    if isinstance(output, tuple):  # classify_records
+        return(sum(len(x) for x in output))
+    return(len(output))
+
+
+def bench_size(workdir, lines, seed=0):
+    """Returns list of stage results for the input of given size."""
+
+    write_workload(workdir, lines=lines, seed=seed)
+
+    results = []
+    for (stage, func) in run_stages(workdir):
+        start = time.perf_counter()
+        output = func()
+        results.append({"stage": stage,
+                        "seconds": time.perf_counter() - start,
+                        "items": count_items(output)})
+
+    # peak memory is measured in a separate pass: tracing slows down
+    # the stages several times
+    for (result, (stage, func)) in zip(results, run_stages(workdir)):
+        tracemalloc.start()
+        func()
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return(results)
+
+
+def main_bench(sizes, output=None):
+    """Benchmark all the sizes; print table and write JSON results."""
+
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "sizes": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for lines in sizes:
+            results = bench_size(workdir, lines)
+            report["sizes"][str(lines)] = results
+            print("input lines: {0}".format(lines))
+            for result in results:
+                print("  {0:<31} {1:9.4f} s {2:9d} items {3:9.1f} MB"
+                      .format(result["stage"], result["seconds"],
+                              result["items"], result["peak_bytes"] / 1e6))
+
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return(report)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(description="Benchmark of main stages")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000, 1000000],
+                        help="numbers of input lines")
+    parser.add_argument("--output", default="bench_stages.json",
+                        help="JSON results file (default: bench_stages.json)")
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_bench(args.sizes, args.output)
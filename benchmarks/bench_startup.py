@@ -0,0 +1,96 @@
+"""
+Cold-start benchmark: wall time of a new Python process running
+main.py (or the run.py launcher, which loads main.py from its cached
+bytecode) on a small input, from the start of the process to the written
+answers, compared with the bare interpreter startup and, optionally,
+with another version of main.py, e.g. one saved by
+git show HEAD~1:main.py > /tmp/old/main.py
+With PYTHONDONTWRITEBYTECODE set the bytecode is not cached, and run.py
+compiles main.py on every run as well.
+Every command is run in the directory with input.txt, since older
+versions of main.py read input.txt from the current directory.
+Run from the package directory:
+python benchmarks/bench_startup.py [--runs 20] [--baseline /tmp/old/main.py]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sample_input = ("glob is I\n"
+                "prok is V\n"
+                "pish is X\n"
+                "tegj is L\n"
+                "glob glob Silver is 34 Credits\n"
+                "how much is pish tegj glob glob ?\n"
+                "how many Credits is glob prok Silver ?\n")
+
+
+def time_command(command, runs, cwd=None):
+    """Returns list of wall times of the command run in cwd in seconds."""
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, cwd=cwd)
+        times.append(time.perf_counter() - start)
+    return(times)
+
+
+def main_bench(runs=20, baseline=None):
+    """Time the commands; print table and return {name: median time}."""
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "input.txt"), "w",
+                  encoding="utf-8") as f:
+            f.write(sample_input)
+
+        commands = [("python -c pass", [sys.executable, "-c", "pass"]),
+                    ("main.py", [sys.executable,
+                                 os.path.join(package_dir, "main.py"),
+                                 workdir]),
+                    ("run.py", [sys.executable,
+                                os.path.join(package_dir, "run.py"),
+                                workdir])]
+        if baseline is not None:
+            commands.append(("baseline " + baseline,
+                             [sys.executable, os.path.abspath(baseline),
+                              workdir]))
+
+        for (name, command) in commands:
+            time_command(command, 2, workdir)  # warm up OS and __pycache__
+        # runs of the commands are interleaved, so that changes of the
+        # machine load affect all of them alike:
+        times = {name: [] for (name, command) in commands}
+        for _ in range(runs):
+            for (name, command) in commands:
+                times[name].extend(time_command(command, 1, workdir))
+
+        results = {}
+        for (name, command) in commands:
+            results[name] = statistics.median(times[name])
+            print("{0:<40} median {1:8.1f} ms  min {2:8.1f} ms".format(
+                name, results[name] * 1e3, min(times[name]) * 1e3))
+    return(results)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(description="Cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=20,
+                        help="number of runs of every command")
+    parser.add_argument("--baseline", default=None,
+                        help="other main.py to compare with")
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_bench(args.runs, args.baseline)
@@ -0,0 +1,127 @@
+"""
+Synthetic workload generator: writes large realistic input.txt files
+with configurable number of Intergalactic numerals, goods, price lines,
+query mix and ratio of erroneous lines.
+Run from the package directory:
+python benchmarks/generate_workload.py WORKDIR --lines 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+
+# make main.py importable when the script is run from any directory:
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from main import int_to_roman  # noqa: E402
+
+roman_symbols = "ivxlcdm"
+syllables = ["gl", "pr", "sh", "tj", "bl", "mt", "ga", "ok", "ish", "eg",
+             "in", "ot", "ra", "ku", "ze", "fo"]
+
+
+def make_words(count, rnd, prefix=""):
+    """Returns list of count distinct random words."""
+
+    words = []
+    seen = set()
+    while len(words) < count:
+        word = prefix + "".join(rnd.choice(syllables)
+                                for _ in range(rnd.randint(2, 3)))
+        if word not in seen and len(word) > 1:
+            seen.add(word)
+            words.append(word)
+    return(words)
+
+
+def generate_lines(lines=100000, numerals=7, goods=20, price_lines=100,
+                   conversion_ratio=0.45, price_query_ratio=0.45,
+                   error_ratio=0.1, max_number=3999, seed=0):
+    """Yield input lines (without newline): dictionary lines, then
+    price lines, then queries mixed with erroneous lines. Conversion and
+    price queries take conversion_ratio and price_query_ratio of the
+    queries, the rest are unrecognized queries. Unit prices are integer,
+    so repeated price lines of the same good are not contradicting."""
+
+    rnd = random.Random(seed)
+    if numerals < len(roman_symbols):
+        raise ValueError("at least {0} numerals are needed"
+                         .format(len(roman_symbols)))
+
+    # every Roman symbol gets at least one Intergalactic numeral:
+    numeral_words = make_words(numerals, rnd)
+    roman_numerals = {x: [] for x in roman_symbols}
+    for (i, numeral) in enumerate(numeral_words):
+        roman = roman_symbols[i] if i < len(roman_symbols) \
+            else rnd.choice(roman_symbols)
+        roman_numerals[roman].append(numeral)
+        yield("{0} is {1}".format(numeral, roman.upper()))
+
+    def random_number():
+        """Returns random Intergalactic number and its value."""
+        value = rnd.randint(1, max_number)
+        return(" ".join(rnd.choice(roman_numerals[x])
+                        for x in int_to_roman(value)), value)
+
+    good_names = [x.capitalize() for x in make_words(goods, rnd, "z")]
+    unit_prices = {x: rnd.randint(1, 1000) for x in good_names}
+    for i in range(price_lines):
+        good = good_names[i % goods]
+        number, quantity = random_number()
+        yield("{0} {1} is {2} Credits".format(
+            number, good, unit_prices[good] * quantity))
+
+    error_lines = ["how much wood could a woodchuck chuck ?",
+                   "this line is not recognized",
+                   "{0} is Q".format(numeral_words[0]),
+                   "{0} Dirt is 12xy Credits".format(numeral_words[0]),
+                   "how many Credits is {0} {0} {0} {0} {1} ?".format(
+                       roman_numerals["i"][0], good_names[0])]
+    for _ in range(lines - numerals - price_lines):
+        choice = rnd.random()
+        if choice < error_ratio:
+            yield(rnd.choice(error_lines))
+            continue
+        choice = rnd.random()
+        if choice < conversion_ratio:
+            yield("how much is {0} ?".format(random_number()[0]))
+        elif choice < conversion_ratio + price_query_ratio:
+            yield("how many Credits is {0} {1} ?".format(
+                random_number()[0], rnd.choice(good_names)))
+        else:
+            yield("how much wood could a woodchuck chuck if a woodchuck "
+                  "could chuck wood ?")
+
+
+def write_workload(workdir, **kwargs):
+    """Write generated input.txt to workdir; returns its path."""
+
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, "input.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        for line in generate_lines(**kwargs):
+            f.write(line + "\n")
+    return(path)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(description="Workload generator")
+    parser.add_argument("workdir", help="directory to write input.txt to")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--numerals", type=int, default=7)
+    parser.add_argument("--goods", type=int, default=20)
+    parser.add_argument("--price-lines", type=int, default=100)
+    parser.add_argument("--conversion-ratio", type=float, default=0.45)
+    parser.add_argument("--price-query-ratio", type=float, default=0.45)
+    parser.add_argument("--error-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    args = vars(parse_args())
+    print(write_workload(args.pop("workdir"), **args))
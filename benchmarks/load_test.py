@@ -0,0 +1,138 @@
+"""
+Load test of the query server: several pipelined client connections
+send queries, latency of every query is measured from sending the line
+to receiving its response, and p50/p99 latency and throughput are reported.
+Without --port/--unix the server is started in this process.
+Run from the package directory: python benchmarks/load_test.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+
+# make main.py and server.py importable from any directory:
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from main import int_to_roman  # noqa: E402
+from server import QueryServer  # noqa: E402
+
+definitions = ["glob is I", "prok is V", "pish is X", "tegj is L",
+               "blin is C", "mott is D", "gaa is M",
+               "glob glob Silver is 34 Credits",
+               "glob prok Gold is 57800 Credits",
+               "pish pish Iron is 3910 Credits"]
+
+
+def make_queries(count, seed=0):
+    """Returns list of random query lines."""
+
+    roman_intergal_dict = {x.split()[2].lower(): x.split()[0]
+                           for x in definitions[:7]}
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        number = " ".join([roman_intergal_dict[x]
+                           for x in int_to_roman(rnd.randint(1, 3999))])
+        if rnd.random() < 0.5:
+            queries.append("how much is {0} ?".format(number))
+        else:
+            queries.append("how many Credits is {0} {1} ?".format(
+                number, rnd.choice(["Silver", "Gold", "Iron"])))
+    return(queries)
+
+
+def percentile(sorted_values, fraction):
+    """Returns percentile of the sorted list of values."""
+
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return(sorted_values[index])
+
+
+async def run_client(connect, queries, depth, latencies):
+    """Send queries keeping at most depth of them in flight."""
+
+    reader, writer = await connect()
+    for line in definitions:  # definitions are sent before the queries
+        writer.write(line.encode("utf-8") + b"\n")
+        await reader.readline()
+
+    in_flight = deque()
+    window = asyncio.Semaphore(depth)
+
+    async def receive():
+        for _ in range(len(queries)):
+            await reader.readline()
+            latencies.append(time.perf_counter() - in_flight.popleft())
+            window.release()
+
+    receiver = asyncio.create_task(receive())
+    for line in queries:
+        await window.acquire()
+        in_flight.append(time.perf_counter())
+        writer.write(line.encode("utf-8") + b"\n")
+        await writer.drain()
+    await receiver
+    writer.close()
+
+
+async def load_test(args):
+    """Run the load test and print the report."""
+
+    server = None
+    if args.unix is not None:
+        def connect():
+            return(asyncio.open_unix_connection(args.unix))
+    else:
+        port = args.port
+        if port is None:  # start the server in this process
+            server = await QueryServer().start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+
+        def connect():
+            return(asyncio.open_connection("127.0.0.1", port))
+
+    latencies = []
+    per_client = args.queries // args.clients
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_client(connect, make_queries(per_client, seed), args.depth,
+                   latencies)
+        for seed in range(args.clients)])
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+    latencies.sort()
+    print("queries: {0}, clients: {1}, pipeline depth: {2}".format(
+        len(latencies), args.clients, args.depth))
+    print("throughput: {0:.0f} queries/s".format(len(latencies) / elapsed))
+    print("latency p50: {0:.3f} ms, p99: {1:.3f} ms".format(
+        percentile(latencies, 0.50) * 1e3,
+        percentile(latencies, 0.99) * 1e3))
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(description="Query server load test")
+    parser.add_argument("--port", type=int, default=None,
+                        help="port of running server on 127.0.0.1")
+    parser.add_argument("--unix", default=None,
+                        help="Unix socket path of running server")
+    parser.add_argument("--queries", type=int, default=100000,
+                        help="total number of queries (default: 100000)")
+    parser.add_argument("--clients", type=int, default=4,
+                        help="number of connections (default: 4)")
+    parser.add_argument("--depth", type=int, default=32,
+                        help="queries in flight per connection (default: 32)")
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    asyncio.run(load_test(parse_args()))
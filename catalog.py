@@ -0,0 +1,308 @@
+"""
+Incremental catalog of Intergalactic numerals and goods prices.
+Unlike create_intergal_roman_dict and calculate_goods_prices, which
+build the tables from complete lists of lines and stop execution on
+contradictions, the catalog is updated entry by entry and reports
+rejected and contradicting entries as UpdateResult values.
+CatalogRegistry keeps compiled tables of many tenants (merchants) in one
+process, sharing identical dictionaries and price tables between them.
+"""
+
+import hashlib
+import marshal
+import sys
+from collections import OrderedDict, namedtuple
+
+from main import (AnswerCache, IntergalacticConverter, PriceLine,
+                  calculate_prices_from_records, classify_records,
+                  create_dict_from_records, exact_unit_price, format_credits,
+                  format_rejected, parse_exact_price, roman_to_arabic_digits,
+                  run_queries, validate_dict_records, validate_price_records)
+
+# Result of catalog update: status is one of "added", "unchanged",
+# "conflict", "rejected", "removed", "not_found"; message explains it.
+UpdateResult = namedtuple("UpdateResult", ["status", "message"])
+
+
+class Catalog:
+    """Intergalactic -> Roman dictionary and unit prices of goods,
+    updated in O(1) per entry. Cached conversions and answers depending
+    on a changed numeral or good are invalidated."""
+
+    def __init__(self, answer_cache_size=65536):
+        self.intergal_roman_dict = {}
+        self.goods_prices = {}
+        self.converter = IntergalacticConverter(self.intergal_roman_dict)
+        self.answer_cache = AnswerCache(answer_cache_size) \
+            if answer_cache_size else None
+
+    def _invalidate_answers(self, name):
+        """Drop cached answers depending on the numeral or good."""
+
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(name)
+
+    def add_numeral(self, numeral, roman):
+        """Add Intergalactic numeral corresponding to single Roman symbol."""
+
+        numeral, roman = numeral.lower(), roman.lower()
+        if len(roman) != 1 or roman not in roman_to_arabic_digits:
+            return(UpdateResult("rejected", "'{0}' is not a Roman numeral"
+                                .format(roman)))
+
+        known_roman = self.intergal_roman_dict.get(numeral)
+        if known_roman == roman:
+            return(UpdateResult("unchanged", "numeral '{0}' already defined"
+                                .format(numeral)))
+        if known_roman is not None:
+            return(UpdateResult(
+                "conflict", "numeral '{0}' is already defined as '{1}'"
+                .format(numeral, known_roman)))
+
+        # New numeral does not change conversions cached so far:
+        # only valid numbers made of already known numerals are cached.
+        self.intergal_roman_dict[numeral] = roman
+        self._invalidate_answers(numeral)
+        return(UpdateResult("added", "numeral '{0}' is '{1}'"
+                            .format(numeral, roman)))
+
+    def add_price(self, quantity_intergalactic, good, price):
+        """Add price (str, as in price lines) of the given Intergalactic
+        quantity (list of numerals) of the good."""
+
+        quantity_intergalactic = tuple(x.lower()
+                                       for x in quantity_intergalactic)
+        good = good.lower()
+        record = PriceLine(quantity_intergalactic +
+                           (good, "is", price.lower(), "credits"),
+                           quantity_intergalactic, good,
+                           parse_exact_price(price))
+        price_out, rejected = validate_price_records([record], [],
+                                                     self.converter)
+        if rejected:
+            return(UpdateResult("rejected", format_rejected(rejected[0])))
+
+        price_of_unit = exact_unit_price(
+            record.price, self.converter.to_int(record.quantity))
+        known_price = self.goods_prices.get(good)
+        if known_price == price_of_unit:
+            return(UpdateResult("unchanged", "price of '{0}' already defined"
+                                .format(good)))
+        if known_price is not None:
+            return(UpdateResult(
+                "conflict", "unit price of '{0}' is already {1}, not {2}"
+                .format(good, format_credits(known_price, 1),
+                        format_credits(price_of_unit, 1))))
+
+        self.goods_prices[good] = price_of_unit
+        self._invalidate_answers(good)
+        return(UpdateResult("added", "unit price of '{0}' is {1}"
+                            .format(good, format_credits(price_of_unit, 1))))
+
+    def remove(self, name):
+        """Remove Intergalactic numeral and/or good with the given name."""
+
+        name = name.lower()
+        removed = []
+        if self.intergal_roman_dict.pop(name, None) is not None:
+            self.converter.invalidate(name)
+            removed.append("numeral")
+        if self.goods_prices.pop(name, None) is not None:
+            removed.append("good")
+
+        if not removed:
+            return(UpdateResult("not_found", "'{0}' not found in catalog"
+                                .format(name)))
+        self._invalidate_answers(name)
+        return(UpdateResult("removed", "{0} '{1}' removed".format(
+            " and ".join(removed), name)))
+
+    def run_queries(self, query_list):
+        """Execute queries (lists of words or QueryLine records)
+        as run_queries with the catalog tables and caches."""
+
+        return(run_queries(query_list, self.intergal_roman_dict,
+                           self.goods_prices, self.converter,
+                           self.answer_cache))
+
+
+def compile_tables(lines):
+    """Returns tuple (intergal_roman_dict, goods_prices, rejected) compiled
+    from the dictionary and price lines, as in main. Raises ValueError
+    if the lines contradict each other."""
+
+    dict_records, price_records, query_records, rejected = \
+        classify_records(lines)
+    try:
+        dict_records, rejected = validate_dict_records(dict_records,
+                                                       rejected)
+        intergal_roman_dict = create_dict_from_records(dict_records)
+        converter = IntergalacticConverter(intergal_roman_dict)
+        price_records, rejected = validate_price_records(
+            price_records, rejected, converter)
+        goods_prices = calculate_prices_from_records(price_records,
+                                                     converter)
+    except SystemExit as err:
+        raise ValueError(str(err))
+    return(intergal_roman_dict, goods_prices, rejected)
+
+
+def content_key(table):
+    """Returns SHA-256 digest of the content of the dictionary."""
+
+    return(hashlib.sha256(marshal.dumps(sorted(table.items()))).digest())
+
+
+def table_size(table):
+    """Returns approximate memory size of the dictionary in bytes."""
+
+    return(sys.getsizeof(table) +
+           sum(sys.getsizeof(k) + sys.getsizeof(v)
+               for (k, v) in table.items()))
+
+
+# Approximate size of an entry of the conversion cache of a converter:
+converter_cache_entry_size = 200
+
+
+class CatalogRegistry:
+    """Compiled dictionaries and prices of many tenants. Identical
+    dictionaries (with their converters and conversion caches) and price
+    tables are stored once, keyed by content_key. When the approximate
+    memory used by the tables exceeds memory_budget bytes, the least
+    recently used tenants are evicted; an evicted tenant is compiled
+    again by loader(tenant_id) -> lines, if loader is given.
+    The tables of a tenant should not be modified after registration."""
+
+    def __init__(self, memory_budget=64 << 20, loader=None):
+        self.memory_budget = memory_budget
+        self.loader = loader
+        # {tenant ID: (dictionary key, prices key)}, least recently used
+        # first:
+        self.tenants = OrderedDict()
+        # {key: [intergal_roman_dict, converter, size, number of tenants,
+        # number of conversion cache entries counted in memory]}:
+        self.dictionaries = {}
+        # {key: [goods_prices, size, number of tenants]}:
+        self.price_tables = {}
+        # approximate memory used by the shared tables and conversion
+        # caches, updated as tables are added, released and used:
+        self.memory = 0
+        self.evictions = 0
+
+    def register(self, tenant_id, intergal_roman_dict, goods_prices):
+        """Add (or replace) tables of the tenant."""
+
+        if tenant_id in self.tenants:
+            self.remove(tenant_id)
+
+        dict_key = content_key(intergal_roman_dict)
+        shared = self.dictionaries.get(dict_key)
+        if shared is None:
+            shared = self.dictionaries[dict_key] = [
+                intergal_roman_dict,
+                IntergalacticConverter(intergal_roman_dict),
+                table_size(intergal_roman_dict), 0, 0]
+            self.memory += shared[2]
+        shared[3] += 1
+
+        prices_key = content_key(goods_prices)
+        shared = self.price_tables.get(prices_key)
+        if shared is None:
+            shared = self.price_tables[prices_key] = [
+                goods_prices, table_size(goods_prices), 0]
+            self.memory += shared[1]
+        shared[2] += 1
+
+        self.tenants[tenant_id] = (dict_key, prices_key)
+        self.evict(keep=tenant_id)
+
+    def register_lines(self, tenant_id, lines):
+        """Compile tables of the tenant from its dictionary and price
+        lines (other lines are ignored) and add them. Returns rejected
+        lines as Rejected records."""
+
+        intergal_roman_dict, goods_prices, rejected = compile_tables(lines)
+        self.register(tenant_id, intergal_roman_dict, goods_prices)
+        return(rejected)
+
+    def remove(self, tenant_id):
+        """Remove tables of the tenant; shared tables are released
+        when no other tenant uses them."""
+
+        dict_key, prices_key = self.tenants.pop(tenant_id)
+        shared = self.dictionaries[dict_key]
+        shared[3] -= 1
+        if not shared[3]:
+            del self.dictionaries[dict_key]
+            self.memory -= shared[2] + shared[4] * converter_cache_entry_size
+        shared = self.price_tables[prices_key]
+        shared[2] -= 1
+        if not shared[2]:
+            del self.price_tables[prices_key]
+            self.memory -= shared[1]
+
+    def _count_cache(self, dict_key):
+        """Add growth of the conversion cache of the dictionary since
+        it was last counted to the memory usage."""
+
+        shared = self.dictionaries[dict_key]
+        cache_entries = len(shared[1].cache)
+        self.memory += (cache_entries - shared[4]) * \
+            converter_cache_entry_size
+        shared[4] = cache_entries
+
+    def memory_usage(self):
+        """Returns approximate memory used by the shared tables and
+        conversion caches (as of the last run_queries) in bytes."""
+
+        return(self.memory)
+
+    def evict(self, keep=None):
+        """Evict the least recently used tenants (except keep) until
+        the memory usage is within the budget."""
+
+        while self.memory > self.memory_budget:
+            victim = next((x for x in self.tenants if x != keep), None)
+            if victim is None:
+                break
+            self.remove(victim)
+            self.evictions += 1
+
+    def tables(self, tenant_id):
+        """Returns tuple (intergal_roman_dict, goods_prices, converter)
+        of the tenant, compiling evicted tenant by loader. Raises
+        KeyError for unknown tenant."""
+
+        if tenant_id not in self.tenants:
+            if self.loader is None:
+                raise KeyError(tenant_id)
+            self.register_lines(tenant_id, self.loader(tenant_id))
+        self.tenants.move_to_end(tenant_id)  # most recently used
+        dict_key, prices_key = self.tenants[tenant_id]
+        intergal_roman_dict, converter = self.dictionaries[dict_key][:2]
+        return(intergal_roman_dict, self.price_tables[prices_key][0],
+               converter)
+
+    def run_queries(self, tenant_id, query_list):
+        """Execute queries (lists of words or QueryLine records)
+        as run_queries with the tables of the tenant."""
+
+        intergal_roman_dict, goods_prices, converter = \
+            self.tables(tenant_id)
+        out_txt = run_queries(query_list, intergal_roman_dict, goods_prices,
+                              converter)
+        # conversion cache may have grown:
+        self._count_cache(self.tenants[tenant_id][0])
+        self.evict(keep=tenant_id)
+        return(out_txt)
+
+    def stats(self):
+        """Returns dictionary of registry counters."""
+
+        return({"tenants": len(self.tenants),
+                "dictionaries": len(self.dictionaries),
+                "price_tables": len(self.price_tables),
+                "memory_usage": self.memory_usage(),
+                "memory_budget": self.memory_budget,
+                "evictions": self.evictions})
@@ -0,0 +1,281 @@
+"""
+Concurrent ingestion of input lines from several local sources: spooled
+files, named pipes (FIFOs) and Unix sockets. Every source is read by its
+own asyncio task into a bounded queue, so a slow source does not stall
+the others, and fast sources wait when the queue is full (backpressure).
+Lines of all the sources are processed as lines of input.txt in the
+order of arrival, with one dictionary and price table. A query or price
+line using numerals or goods not defined yet is parked until the
+definition arrives from any source, or until all the sources are
+exhausted, so results do not depend on timing of the sources.
+"""
+
+import argparse
+import asyncio
+from collections import OrderedDict
+
+from main import (AnswerCache, DictLine, IntergalacticConverter, PriceLine,
+                  QueryLine, classify_record, int_to_roman, open_out,
+                  process_record)
+from server import read_line
+
+
+async def stream_source(reader):
+    """Yield lines of asyncio StreamReader until end of stream; a line
+    longer than the limit of the reader is skipped and yielded as None."""
+
+    while True:
+        line = await read_line(reader)
+        if line is None:
+            yield None
+            continue
+        if not line:
+            return
+        yield line.decode("utf-8", "replace")
+
+
+async def file_source(path, chunk_bytes=1 << 16):
+    """Yield lines of the regular file, read in chunks of about
+    chunk_bytes in a thread, so the event loop is not blocked."""
+
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            lines = await asyncio.to_thread(f.readlines, chunk_bytes)
+            if not lines:
+                return
+            for line in lines:
+                yield line
+
+
+async def fifo_source(path):
+    """Yield lines of the named pipe until all its writers close it."""
+
+    # opening of FIFO blocks until a writer opens it:
+    pipe = await asyncio.to_thread(open, path, "rb", 0)
+    reader = asyncio.StreamReader()
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    try:
+        async for line in stream_source(reader):
+            yield line
+    finally:
+        transport.close()
+
+
+async def unix_source(path):
+    """Yield lines received from the Unix socket until it is closed."""
+
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        async for line in stream_source(reader):
+            yield line
+    finally:
+        writer.close()
+
+
+class Ingestor:
+    """Dictionary and prices shared by all the sources. Results are
+    passed to emit(source index, line number, file name, text) as soon
+    as they are known; file name is "output.txt" or "errors.txt"."""
+
+    def __init__(self, answer_cache_size=65536, queue_size=1024,
+                 max_parked=65536):
+        self.intergal_roman_dict = {}
+        self.goods_prices = {}
+        self.converter = IntergalacticConverter(self.intergal_roman_dict)
+        self.answer_cache = AnswerCache(answer_cache_size) \
+            if answer_cache_size else None
+        self.queue_size = queue_size
+        self.max_parked = max_parked
+        # {(source index, line number): QueryLine record} of queries
+        # waiting for definitions, and {name: [keys of the queries]}:
+        self.parked = OrderedDict()
+        self.waiting = {}
+        self.source_errors = []
+
+    def missing_names(self, record):
+        """Returns list of names not defined yet which the record needs:
+        numerals of quantities of queries and price lines, goods of price
+        queries, and ("roman", Roman digit) tuples for Roman digits
+        without a numeral needed by "say" queries."""
+
+        record_type = type(record)
+        if record_type is PriceLine:
+            return([x for x in record.quantity
+                    if x not in self.intergal_roman_dict])
+        if record_type is not QueryLine:
+            return([])
+        if record.kind == "say":
+            number = record.quantity[0]
+            if not (number.isascii() and number.isdigit() and
+                    0 < int(number) < 4000):
+                return([])  # cannot be said with any numerals
+            known_roman = set(self.intergal_roman_dict.values())
+            return([("roman", x) for x in set(int_to_roman(int(number)))
+                    if x not in known_roman])
+        if record.kind != "number" and record.kind != "price":
+            return([])
+        missing = [x for x in record.quantity
+                   if x not in self.intergal_roman_dict]
+        if record.kind == "price" and record.good not in self.goods_prices:
+            missing.append(record.good)
+        return(missing)
+
+    def answer(self, key, record, emit):
+        """Process the record and emit its result, if any; then retry
+        the parked records waiting for names defined by the record."""
+
+        try:
+            result = process_record(record, self.intergal_roman_dict,
+                                    self.goods_prices, self.converter,
+                                    self.answer_cache)
+        except SystemExit as err:  # contradiction; tables are not changed
+            result = ("errors.txt", str(err))
+        if result is not None:
+            emit(key[0], key[1], result[0], result[1])
+
+        record_type = type(record)
+        if record_type is DictLine:
+            names = (record.numeral, ("roman", record.roman))
+        elif record_type is PriceLine:
+            names = (record.good,)
+        else:
+            return
+        for name in names:
+            for parked_key in self.waiting.pop(name, []):
+                parked_record = self.parked.pop(parked_key, None)
+                if parked_record is None:  # already answered
+                    continue
+                missing = self.missing_names(parked_record)
+                if missing:
+                    self.park(parked_key, parked_record, missing, emit)
+                else:
+                    self.answer(parked_key, parked_record, emit)
+
+    def park(self, key, record, missing, emit):
+        """Park the record until the missing names are defined; the
+        oldest parked record is processed if too many are parked."""
+
+        self.parked[key] = record
+        for name in missing:
+            self.waiting.setdefault(name, []).append(key)
+        if len(self.parked) > self.max_parked:
+            old_key, old_record = self.parked.popitem(last=False)
+            self.answer(old_key, old_record, emit)
+
+    def process(self, source_index, line_number, line, emit):
+        """Process line number line_number of the source (None: line
+        longer than the limit of the stream)."""
+
+        if line is None:
+            emit(source_index, line_number, "errors.txt",
+                 "REJECTED: line longer than the stream limit")
+            return
+        record = classify_record(line)
+        if record is None:
+            return  # skip empty lines
+        key = (source_index, line_number)
+
+        missing = self.missing_names(record)
+        if missing:
+            self.park(key, record, missing, emit)
+        else:
+            self.answer(key, record, emit)
+
+    def flush(self, emit):
+        """Answer all the parked queries."""
+
+        while self.parked:
+            key, record = self.parked.popitem(last=False)
+            self.answer(key, record, emit)
+        self.waiting.clear()
+
+    async def ingest(self, sources, emit):
+        """Read all the sources (async iterables of lines) concurrently
+        and process their lines. Errors of the sources do not stop the
+        others; they are collected to source_errors."""
+
+        queue = asyncio.Queue(self.queue_size)
+
+        async def produce(source_index, source):
+            line_number = 0
+            async for line in source:
+                line_number += 1
+                await queue.put((source_index, line_number, line))
+
+        async def close():
+            results = await asyncio.gather(
+                *[produce(i, x) for (i, x) in enumerate(sources)],
+                return_exceptions=True)
+            self.source_errors.extend(
+                (i, x) for (i, x) in enumerate(results)
+                if isinstance(x, Exception))
+            await queue.put(None)  # all the sources are exhausted
+
+        closer = asyncio.create_task(close())
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            self.process(*item, emit)
+        await closer
+        self.flush(emit)
+
+
+async def ingest_to_files(sources, workdir="", answer_cache_size=65536,
+                          queue_size=1024):
+    """Ingest the sources and write results to output.txt and errors.txt
+    in workdir, in the same file format as by main(). Returns Ingestor."""
+
+    ingestor = Ingestor(answer_cache_size, queue_size)
+    with open_out(workdir, "output.txt") as out_file, \
+         open_out(workdir, "errors.txt") as err_file:
+        first_output = [True]
+
+        def emit(source_index, line_number, file_name, text):
+            if file_name == "output.txt":
+                # query results are separated by newlines:
+                out_file.write(text if first_output[0] else "\n" + text)
+                first_output[0] = False
+            else:
+                err_file.write(text + "\n")
+
+        await ingestor.ingest(sources, emit)
+        err_file.write("\n")  # errors.txt ends with an empty line
+    return(ingestor)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(
+        description="Merchant's guide to the galaxy: concurrent ingestion")
+    parser.add_argument("workdir", nargs="?", default="",
+                        help="directory to write output.txt and errors.txt "
+                             "to (default: current directory)")
+    parser.add_argument("--file", action="append", default=[],
+                        help="input file (can be repeated)")
+    parser.add_argument("--fifo", action="append", default=[],
+                        help="named pipe (can be repeated)")
+    parser.add_argument("--unix", action="append", default=[],
+                        help="Unix socket to read from (can be repeated)")
+    parser.add_argument("--queue-size", type=int, default=1024,
+                        help="number of lines buffered from all the "
+                             "sources (default: 1024)")
+    parser.add_argument("--answer-cache", type=int, default=65536,
+                        help="size of LRU cache of answers to repeated "
+                             "queries (0: no cache; default: 65536)")
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    """ The ingestion is started from the command line """
+    args = parse_args()
+    sources = [file_source(x) for x in args.file] + \
+        [fifo_source(x) for x in args.fifo] + \
+        [unix_source(x) for x in args.unix]
+    ingestor = asyncio.run(ingest_to_files(sources, args.workdir,
+                                           args.answer_cache,
+                                           args.queue_size))
+    for (source_index, err) in ingestor.source_errors:
+        print("source {0} failed: {1}".format(source_index, err))
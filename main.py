@@ -10,11 +10,83 @@ of the queries and error messages for unrecognized lines.
 Error lines are written to error.txt file. 
 """
 
+import gc
+import marshal
 import os
+import sys
+import time
+from collections import Counter, OrderedDict, namedtuple
+from itertools import chain, islice
+
+# Modules needed only by some of the modes (argparse, bisect,
+# concurrent.futures, decimal, hashlib, importlib, json, math, mmap,
+# numpy, compression modules) are imported on first use, so short runs
+# do not pay for them at startup.
+
+# numpy module, imported by _load_numpy for intergalactic_to_int_batch:
+np = None
+
+# Compression of output files: name -> (module with open function,
+# suffix). bz2 and lzma can be missing in custom Python builds; zstd is
+# in the standard library since Python 3.14.
+output_compressors = {"gzip": ("gzip", ".gz"), "bz2": ("bz2", ".bz2"),
+                      "lzma": ("lzma", ".xz"),
+                      "zstd": ("compression.zstd", ".zst")}
 
 roman_to_arabic_digits = {"i": 1, "v": 5, "x": 10, "l": 50,
                           "c": 100, "d": 500, "m": 1000}
 
+# Typed records of classified input lines (words: tuple of lowercase words
+# of the line). Records contain only strings, tuples and numbers, so they
+# cannot form reference cycles (but, as namedtuple instances, they are
+# still tracked and traversed by the garbage collector).
+# line_number: number of the line in the input (None if not known),
+# kept for the error records of the rejected definitions.
+DictLine = namedtuple("DictLine", ["words", "numeral", "roman",
+                                   "line_number"], defaults=(None,))
+# quantity: tuple of Intergalactic numerals; price: exact price as
+# (numerator, denominator) tuple, or None if it cannot be parsed:
+PriceLine = namedtuple("PriceLine", ["words", "quantity", "good", "price",
+                                     "line_number"], defaults=(None,))
+# kind: "number" (conversion), "price", "say" (integer -> Intergalactic;
+# quantity is tuple of the integer word) or "unknown" query; words of
+# queries are not kept, the answer depends on quantity and good only:
+QueryLine = namedtuple("QueryLine", ["kind", "quantity", "good"])
+
+# Reason codes of rejected lines, and functions rendering the error
+# message of the code from the arguments of the Rejected record:
+REJECT_UNRECOGNIZED = "unrecognized"
+REJECT_ROMAN = "invalid_roman"
+REJECT_QUANTITY = "invalid_quantity"
+REJECT_PRICE = "invalid_price"
+REJECT_NEGATIVE_PRICE = "negative_price"
+reject_reasons = {
+    REJECT_UNRECOGNIZED: lambda: "REJECTED by sort_lines",
+    REJECT_ROMAN: lambda: "REJECTED by validate_dict",
+    REJECT_QUANTITY: lambda quantity: (
+        "REJECTED by validate_price: incorrect Intergalactic quantity "
+        "\'{0}\' in validate_price".format(", ".join(quantity))),
+    REJECT_PRICE: lambda: (
+        "REJECTED by validate_price: cannot convert price to float"),
+    REJECT_NEGATIVE_PRICE: lambda: (
+        "REJECTED by validate_price: negative price")}
+
+
+class Rejected(namedtuple("Rejected", ["words", "code", "args",
+                                       "line_number"],
+                          defaults=((), None))):
+    """Rejected line: words, reason code REJECT_*, arguments of the error
+    message and number of the line (None if not known). The message is
+    rendered only when it is needed, by the reason property."""
+
+    __slots__ = ()
+
+    @property
+    def reason(self):
+        """Error message of errors.txt."""
+
+        return(reject_reasons[self.code](*self.args))
+
 
 def read_input(workdir=""):
     """Read file input.txt in the working directory."""
@@ -22,6 +94,56 @@ def read_input(workdir=""):
     with open(os.path.join(workdir, "input.txt"), "r", encoding="utf-8") as f:
         return(f.read())
 
+
+def iter_input(workdir=""):
+    """Yield lines of input.txt file in the working directory one by one,
+    without reading the whole file into memory."""
+
+    with open(os.path.join(workdir, "input.txt"), "r", encoding="utf-8") as f:
+        for line in f:
+            yield line
+
+
+def iter_input_mmap(workdir=""):
+    """Yield lines of input.txt file in the working directory one by one
+    from memory-mapped file. Only the current line is copied and decoded,
+    so memory use does not depend on the size of the file: pages of the
+    file are read by the OS on demand and can be dropped at any time.
+    Line endings "\r\n" and "\r" are read as "\n", as by iter_input
+    (universal newlines); lines ending with "\r" only are copied
+    together up to the next "\n"."""
+
+    import mmap
+
+    with open(os.path.join(workdir, "input.txt"), "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # empty file cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                if b"\r" in line:  # universal newlines, as in text mode
+                    for part in line.replace(b"\r\n", b"\n") \
+                            .replace(b"\r", b"\n").splitlines(True):
+                        yield part.decode("utf-8")
+                    continue
+                yield line.decode("utf-8")
+
+
+def classify_line(words):
+    """Returns type of the line given as list of lowercase words:
+    "dict", "price", "query" or "unknown"."""
+
+    if len(words) == 3 and words[1] == "is":  # Dictionary line
+        return("dict")
+
+    if len(words) >= 5 and words[-1] == "credits" and words[-3] == "is":
+        return("price")  # Price list line
+
+    if words[-1] == "?":   # Query line
+        return("query")
+
+    return("unknown")  # Unrecognized line
+
+
 def sort_lines(input_text):
     """Sort input text to lists of lines, containing
     i) Intergalactic-Roman dictionary; ii) goods prices; 
@@ -31,6 +153,8 @@ def sort_lines(input_text):
     price_list = []
     query_list = []
     unknown_list = []
+    sorted_lists = {"dict": dict_list, "price": price_list,
+                    "query": query_list}
 
     for line in input_text.split("\n"):
         words = line.lower().split()
@@ -38,22 +162,236 @@ def sort_lines(input_text):
         if not words:
             continue  # skip empty lines
 
-        if len(words) == 3 and words[1] == "is":  # Dictionary line
-            dict_list.append(words)
-            continue
+        line_type = classify_line(words)
+        if line_type == "unknown":
+            unknown_list.append(words + ["REJECTED by sort_lines"])
+        else:
+            sorted_lists[line_type].append(words)
 
-        if len(words) >= 5 and words[-1] == "credits" and words[-3] == "is":
-            price_list.append(words)  # Price list line
-            continue
+    return(dict_list, price_list, query_list, unknown_list)
 
-        if words[-1] == "?":   # Query line
-            query_list.append(words)
-            continue
 
-        # Unrecognized line:
-        unknown_list.append(words + ["REJECTED by sort_lines"])
+# Records are created with tuple.__new__, bypassing Python-level
+# namedtuple constructors in the per-line classification:
+_new_record = tuple.__new__
 
-    return(dict_list, price_list, query_list, unknown_list)
+
+# Trie of query forms: {word: subtree}; key None of a subtree holds
+# (kind, parse function, prefix length) of the form ending there:
+query_trie = {}
+# Query kind -> function answering QueryLine records of the kind:
+query_answerers = {}
+
+
+def register_query_form(prefix, kind, parse, answer):
+    """Register query form starting with prefix (tuple of lowercase
+    words). parse(words, prefix_length) returns tuple (quantity, good)
+    of the query given as tuple of words, or None if the query does not
+    match the form; answer(query, goods_prices, converter) returns result
+    or error message of the QueryLine record of the kind."""
+
+    node = query_trie
+    for word in prefix:
+        node = node.setdefault(word, {})
+    node[None] = (kind, parse, len(prefix))
+    query_answerers[kind] = answer
+
+
+def parse_query(words):
+    """Returns QueryLine record for query given as tuple of lowercase
+    words. The query form with the longest matching prefix is found
+    by walking query_trie, one dictionary lookup per word."""
+
+    node = query_trie
+    form = None
+    for word in words:
+        node = node.get(word)
+        if node is None:
+            break
+        form = node.get(None, form)
+
+    if form is not None:
+        kind, parse, prefix_length = form
+        parsed = parse(words, prefix_length)
+        if parsed is not None:
+            return(_new_record(QueryLine, (kind,) + parsed))
+    return(_new_record(QueryLine, ("unknown", (), None)))
+
+
+def parse_price(price_text):
+    """Returns price as float (decimal separator can be "." or ","),
+    or None if the price cannot be converted to float."""
+
+    try:
+        return(float(price_text.replace(",", ".", 1)))
+    except ValueError:
+        return(None)
+
+
+# Largest decimal exponent of exact prices: integers of 10 ** exponent
+# digits would take unbounded time and memory (e.g. price "1e100000000"):
+MAX_PRICE_EXPONENT = 1000
+
+
+def parse_exact_price(price_text):
+    """Returns exact price as tuple (numerator, denominator) of integers
+    in lowest terms (decimal separator can be "." or ","), or None if the
+    price is not a finite decimal number, or its exponent is out of
+    the -MAX_PRICE_EXPONENT:MAX_PRICE_EXPONENT range."""
+
+    # plain integers (most of the prices) are parsed without decimal:
+    if price_text.isascii() and price_text.isdigit() and \
+       len(price_text) <= MAX_PRICE_EXPONENT:
+        return(int(price_text), 1)
+
+    from decimal import Decimal, InvalidOperation
+
+    try:
+        price = Decimal(price_text.replace(",", ".", 1))
+    except InvalidOperation:
+        return(None)
+    if not price.is_finite():
+        return(None)
+    if abs(price.adjusted()) > MAX_PRICE_EXPONENT or \
+       abs(price.as_tuple().exponent) > MAX_PRICE_EXPONENT:
+        return(None)
+    return(price.as_integer_ratio())
+
+
+def exact_unit_price(price, quantity_int):
+    """Returns exact price (numerator, denominator) of one unit
+    for exact price of quantity_int units."""
+
+    from math import gcd
+
+    numerator, denominator = price[0], price[1] * quantity_int
+    common = gcd(numerator, denominator)
+    return(numerator // common, denominator // common)
+
+
+def format_credits(unit_price, quantity_int):
+    """Returns price of quantity_int units in Credits as written in
+    output.txt: integer, or rounded to four decimal places. Exact unit
+    prices (numerator, denominator) are computed with integer arithmetic
+    (rounding half up, as decimal ties were printed by the float path);
+    float unit prices are also accepted."""
+
+    if isinstance(unit_price, tuple):
+        numerator = unit_price[0] * quantity_int
+        denominator = unit_price[1]
+        if numerator % denominator == 0:  # integer price
+            return(str(numerator // denominator))
+        scaled, remainder = divmod(numerator * 10000, denominator)
+        if 2 * remainder >= denominator:
+            scaled += 1
+        return("%d.%04d" % divmod(scaled, 10000))
+
+    price_total = unit_price * quantity_int
+    if price_total % 1 == 0:  # integer price
+        return(str(int(price_total)))
+    return("{:.4f}".format(price_total))
+
+
+def classify_record(line, line_number=None):
+    """Classify input line in a single pass. Returns typed record
+    DictLine, PriceLine, QueryLine or Rejected, or None for empty line.
+    Quantities, goods and prices are parsed once here; line_number is
+    kept in the records of definitions and rejected lines."""
+
+    words = tuple(line.lower().split())
+    if not words:
+        return(None)  # skip empty lines
+
+    word_count = len(words)
+    if word_count == 3 and words[1] == "is":  # Dictionary line
+        return(_new_record(DictLine, (words, words[0], words[2],
+                                      line_number)))
+
+    last_word = words[-1]
+    if last_word == "?":  # Query line
+        return(parse_query(words))
+
+    if last_word == "credits" and word_count >= 5 and words[-3] == "is":
+        return(_new_record(PriceLine, (words, words[:-4], words[-4],
+                                       parse_exact_price(words[-2]),
+                                       line_number)))
+
+    return(_new_record(Rejected, (words, REJECT_UNRECOGNIZED, (),
+                                  line_number)))
+
+
+def classify_records(lines, disable_gc=False, query_line_numbers=None):
+    """Same as sort_lines for iterable of input lines, but returns
+    lists of DictLine, PriceLine, QueryLine and Rejected records.
+    Lines are numbered from 1; if query_line_numbers list is given,
+    line numbers of the QueryLine records are appended to it (queries
+    do not keep them, so that repeated queries are equal records).
+    With disable_gc, the garbage collector
+    is disabled while the lists grow; the GC state is process-global,
+    so this is not safe when other threads run."""
+
+    dict_records = []
+    price_records = []
+    query_records = []
+    rejected = []
+    appenders = {DictLine: dict_records.append,
+                 PriceLine: price_records.append,
+                 QueryLine: query_records.append,
+                 Rejected: rejected.append}
+
+    # Records cannot form reference cycles, so the garbage collector
+    # would only waste time traversing them while the lists grow:
+    gc_enabled = gc.isenabled()
+    if disable_gc:
+        gc.disable()
+    try:
+        for (line_number, line) in enumerate(lines, 1):
+            record = classify_record(line, line_number)
+            if record is not None:
+                appenders[type(record)](record)
+                if query_line_numbers is not None and \
+                   type(record) is QueryLine:
+                    query_line_numbers.append(line_number)
+    finally:
+        if disable_gc and gc_enabled:
+            gc.enable()
+
+    return(dict_records, price_records, query_records, rejected)
+
+
+def format_rejected(record):
+    """Returns line of errors.txt for Rejected record."""
+
+    return(" ".join(record.words) + " " + record.reason)
+
+
+# Formats of errors.txt written by main, see render_rejected:
+errors_formats = ("text", "jsonl", "counts")
+
+
+def render_rejected(rejected, errors_format="text"):
+    """Returns iterable of lines of errors.txt for Rejected records,
+    rendered as they are consumed:
+    "text": line with error message per record and empty line at the end;
+    "jsonl": compact JSON object per record with line number, reason code,
+    words of the line and arguments of the message;
+    "counts": JSON object {reason code: number of rejected lines}."""
+
+    if errors_format == "text":
+        return(chain(map(format_rejected, rejected), ["\n"]))
+
+    import json
+
+    if errors_format == "jsonl":
+        dumps = json.JSONEncoder(separators=(",", ":")).encode
+        return(chain((dumps({"line": x.line_number, "code": x.code,
+                             "words": " ".join(x.words), "args": x.args})
+                      for x in rejected), [""]))
+    if errors_format == "counts":
+        return([json.dumps(Counter(x.code for x in rejected),
+                           sort_keys=True), ""])
+    raise ValueError("errors format should be one of: {0}".format(
+        ", ".join(errors_formats)))
 
 
 def validate_dict(dict_list, unknown_list):
@@ -72,18 +410,21 @@ def validate_dict(dict_list, unknown_list):
     return(dict_out, unknown_list)
 
 
-def validate_price(price_list, unknown_list, intergal_roman_dict):
+def validate_price(price_list, unknown_list, intergal_roman_dict,
+                   converter=None):
     """Checks whether third word of price line from the end contains
     correct non-negative decimal number. Correct entries returned
     as first element of output tuple, and incorrect as the second
     element of output tuple."""
 
+    if converter is None:
+        converter = IntergalacticConverter(intergal_roman_dict)
+
     price_out = []
     for price_entry in price_list:
         quantity_intergalactic = price_entry[0:-4]
         try:
-            int_quantity = intergalactic_to_int(quantity_intergalactic,
-                                                intergal_roman_dict)
+            int_quantity = converter.to_int(quantity_intergalactic)
         except ValueError:
             unknown_list.append(price_entry + [
                 "REJECTED by validate_price: incorrect Intergalactic quantity "
@@ -108,6 +449,153 @@ def validate_price(price_list, unknown_list, intergal_roman_dict):
     return(price_out, unknown_list)
 
 
+def validate_dict_records(dict_records, rejected):
+    """Same as validate_dict for DictLine records;
+    incorrect entries are appended to rejected."""
+
+    dict_out = []
+    for record in dict_records:
+        if len(record.roman) != 1 or \
+           record.roman not in roman_to_arabic_digits:
+            rejected.append(Rejected(record.words, REJECT_ROMAN, (),
+                                     record.line_number))
+            continue
+        dict_out.append(record)
+    return(dict_out, rejected)
+
+
+def validate_price_records(price_records, rejected, converter):
+    """Same as validate_price for PriceLine records;
+    incorrect entries are appended to rejected."""
+
+    price_out = []
+    for record in price_records:
+        try:
+            converter.to_int(record.quantity)
+        except ValueError:
+            rejected.append(Rejected(record.words, REJECT_QUANTITY,
+                                     (record.quantity,), record.line_number))
+            continue
+
+        if record.price is None:  # could not parse the price
+            rejected.append(Rejected(record.words, REJECT_PRICE, (),
+                                     record.line_number))
+        elif record.price[0] < 0:  # negative price
+            rejected.append(Rejected(record.words, REJECT_NEGATIVE_PRICE,
+                                     (), record.line_number))
+        else:
+            price_out.append(record)
+    return(price_out, rejected)
+
+
+def create_dict_from_records(dict_records):
+    """Same as create_intergal_roman_dict for DictLine records."""
+
+    intergal_roman_dict = {}
+    for record in dict_records:
+        if intergal_roman_dict.setdefault(record.numeral, record.roman) \
+           != record.roman:
+            raise SystemExit("Contradicting entries in input dictionary!")
+    return(intergal_roman_dict)
+
+
+def calculate_prices_from_records(price_records, converter):
+    """Same as calculate_goods_prices for validated PriceLine records,
+    but unit prices are exact (numerator, denominator) tuples."""
+
+    goods_prices = {}
+    for record in price_records:
+        price_of_unit = exact_unit_price(record.price,
+                                         converter.to_int(record.quantity))
+        if goods_prices.setdefault(record.good, price_of_unit) \
+           != price_of_unit:
+            raise SystemExit("Contradicting entries in input prices!")
+    return(goods_prices)
+
+
+class PriceHistory:
+    """Unit prices of goods over time: for every good, sorted sequence
+    numbers of its price lines (line numbers of the input) and the unit
+    prices set by them, in parallel lists. Price of a good as of any
+    sequence number is found by bisection in O(log n); a later price
+    line re-prices the good instead of contradicting it."""
+
+    def __init__(self):
+        self.sequences = {}
+        self.prices = {}
+        self.last_sequence = 0
+
+    @classmethod
+    def from_records(cls, price_records, converter):
+        """Returns history of validated PriceLine records; records
+        without line number get the next sequence number."""
+
+        history = cls()
+        for record in price_records:
+            history.add(record.good,
+                        exact_unit_price(record.price,
+                                         converter.to_int(record.quantity)),
+                        record.line_number)
+        return(history)
+
+    def add(self, good, unit_price, sequence=None):
+        """Set unit price of the good from the sequence number on
+        (default: next after the last one). Appending in order of the
+        sequence numbers is O(1); earlier numbers are inserted."""
+
+        if sequence is None:
+            sequence = self.last_sequence + 1
+        self.last_sequence = max(self.last_sequence, sequence)
+        sequences = self.sequences.setdefault(good, [])
+        prices = self.prices.setdefault(good, [])
+        if not sequences or sequence > sequences[-1]:
+            sequences.append(sequence)
+            prices.append(unit_price)
+            return
+        from bisect import bisect_left
+
+        i = bisect_left(sequences, sequence)
+        if i < len(sequences) and sequences[i] == sequence:
+            prices[i] = unit_price  # price line replaced
+        else:
+            sequences.insert(i, sequence)
+            prices.insert(i, unit_price)
+
+    def reprice(self, unit_prices, sequence=None):
+        """Set unit prices of many goods ({good: unit price}) at the same
+        sequence number (default: next after the last one)."""
+
+        if sequence is None:
+            sequence = self.last_sequence + 1
+        for (good, unit_price) in unit_prices.items():
+            self.add(good, unit_price, sequence)
+
+    def price_at(self, good, sequence=None):
+        """Returns unit price of the good as of the sequence number
+        (default: the latest price), or None if it has no price yet."""
+
+        prices = self.prices.get(good)
+        if prices is None:
+            return(None)
+        if sequence is None:
+            return(prices[-1])
+        from bisect import bisect_right
+
+        i = bisect_right(self.sequences[good], sequence)
+        return(prices[i - 1] if i else None)
+
+    def goods_prices(self, sequence=None):
+        """Returns {good: unit price} as of the sequence number (default:
+        the latest prices), as calculate_prices_from_records."""
+
+        goods_prices = {}
+        for good in self.prices:
+            unit_price = self.price_at(good, sequence)
+            if unit_price is not None:
+                goods_prices[good] = unit_price
+        return(goods_prices)
+
+
 def create_intergal_roman_dict(dict_list):
     """Returns dictionary {Intergalactic numerals: Roman symbols}.
     If contradictory dictionary entries exist, execution stops."""
@@ -123,6 +611,12 @@ def create_intergal_roman_dict(dict_list):
     return(intergal_roman_dict)
 
 
+# (integer, Roman symbols) pairs in descending order, used by int_to_roman:
+int_to_roman_digits = ((1000, "m"), (900, "cm"), (500, "d"), (400, "cd"),
+                       (100, "c"), (90, "xc"), (50, "l"), (40, "xl"),
+                       (10, "x"), (9, "ix"), (5, "v"), (4, "iv"), (1, "i"))
+
+
 def int_to_roman(int_input):
     """Convert integer number to Roman
     using straightforvard algorithm."""
@@ -132,22 +626,61 @@ def int_to_roman(int_input):
     if int_input < 0 or int_input >= 4000:
         raise ValueError("Roman number should be in 1:3999 range in "
                          "int_to_roman")
-    
-    # int_roman:sym_roman dictionary:
-    dict_int_to_roman = {1000: "m", 900: "cm", 500: "d", 400: "cd", 100: "c",
-                         90: "xc", 50: "l", 40: "xl", 10: "x", 9: "ix",
-                         5: "v", 4: "iv", 1: "i"}
+
     out_roman = []
-    for (int_roman, sym_roman) in dict_int_to_roman.items():
-        # how many times int_roman number fits in input:
-        count_roman_symbol = int(int_input / int_roman)
+    for (int_roman, sym_roman) in int_to_roman_digits:
+        # how many times int_roman number fits in input, and the rest:
+        count_roman_symbol, int_input = divmod(int_input, int_roman)
         # add count_roman_symbol of sym_roman symbols to result:
         out_roman.append(sym_roman * count_roman_symbol)
-        # decrease input integer by added output number:
-        int_input -= int_roman * count_roman_symbol
     return("".join(out_roman))
 
 
+def roman_to_numerals(intergal_roman_dict):
+    """Returns Roman symbol -> Intergalactic numeral dictionary;
+    if several numerals denote the same symbol, the first defined
+    numeral is used."""
+
+    roman_intergal_dict = {}
+    for (numeral, roman) in intergal_roman_dict.items():
+        roman_intergal_dict.setdefault(roman, numeral)
+    return(roman_intergal_dict)
+
+
+def int_to_intergalactic(int_input, intergal_roman_dict):
+    """Returns Intergalactic number (tuple of numerals) of the integer
+    in 1:3999 range using provided Intergalactic -> Roman dictionary.
+    Raises ValueError if the number is out of range or the dictionary
+    has no numeral for some of its Roman symbols."""
+
+    if not isinstance(int_input, int) or not 0 < int_input < 4000:
+        raise ValueError("number should be in 1:3999 range in "
+                         "int_to_intergalactic")
+    roman_intergal_dict = roman_to_numerals(intergal_roman_dict)
+    try:
+        return(tuple(roman_intergal_dict[x] for x in int_to_roman(int_input)))
+    except KeyError as err:
+        raise ValueError("no Intergalactic numeral for Roman numeral '{0}' "
+                         "in int_to_intergalactic".format(err.args[0]))
+
+
+def build_intergalactic_table(intergal_roman_dict):
+    """Returns tuple of Intergalactic numbers (tuples of numerals) indexed
+    by integers 0:3999; entry is None if the number cannot be written
+    with the numerals of the dictionary, entry 0 is empty number."""
+
+    roman_intergal_dict = roman_to_numerals(intergal_roman_dict)
+    int_to_roman_table = get_roman_tables()[1]
+    table = [()]
+    for int_input in range(1, 4000):
+        try:
+            table.append(tuple(roman_intergal_dict[x]
+                               for x in int_to_roman_table[int_input]))
+        except KeyError:
+            table.append(None)
+    return(tuple(table))
+
+
 def not_in_dict(input_list, input_dict):
     """Return elements of input_list not being keys of input_dict."""
 
@@ -211,28 +744,451 @@ def intergalactic_to_int(intergalactic_number, intergal_roman_dict):
         raise ValueError("input number should be in 1:3999 range") 
 
 
-def calculate_goods_prices(price_list, intergal_roman_dict):
+def build_roman_tables():
+    """Returns tuple of dictionaries ({canonical Roman numeral: integer},
+    {integer: canonical Roman numeral}) for the 1:3999 range."""
+
+    int_roman_table = {x: int_to_roman(x) for x in range(1, 4000)}
+    roman_int_table = {v: k for (k, v) in int_roman_table.items()}
+    return(roman_int_table, int_roman_table)
+
+
+# Frozen conversion tables, written at build time by save_roman_tables
+# (python main.py --build-tables); loading them is several times faster
+# than building the tables at import:
+ROMAN_TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "roman_tables.bin")
+ROMAN_TABLES_MAGIC = b"MGTAB"
+ROMAN_TABLES_VERSION = 1
+
+
+def save_roman_tables(path=ROMAN_TABLES_PATH):
+    """Write tables of build_roman_tables to the frozen tables file."""
+
+    payload = marshal.dumps(build_roman_tables())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(ROMAN_TABLES_MAGIC + bytes([ROMAN_TABLES_VERSION]) + payload)
+    os.replace(tmp_path, path)  # readers never see partially written file
+
+
+def load_roman_tables(path=ROMAN_TABLES_PATH):
+    """Returns tables of build_roman_tables from the frozen tables file,
+    or None if the file does not exist, has other format version
+    or is damaged."""
+
+    header = ROMAN_TABLES_MAGIC + bytes([ROMAN_TABLES_VERSION])
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return(None)
+    if not data.startswith(header):
+        return(None)
+    try:
+        roman_int_table, int_roman_table = marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):  # damaged tables file
+        return(None)
+    if len(int_roman_table) != 3999 or len(roman_int_table) != 3999:
+        return(None)
+    return(roman_int_table, int_roman_table)
+
+
+# Conversion tables, loaded (or built, without the frozen tables file)
+# by get_roman_tables on first use, so that runs which do not need them
+# do not pay for loading at startup:
+_roman_tables = None
+
+
+def get_roman_tables():
+    """Returns conversion tables (roman_to_int_table, int_to_roman_table)
+    of build_roman_tables, loaded on the first call."""
+
+    global _roman_tables
+    if _roman_tables is None:
+        _roman_tables = load_roman_tables() or build_roman_tables()
+    return(_roman_tables)
+
+
+# Positions of canonical Roman numerals, from thousands to units, as
+# (digit of 1, digit of 5, digit of 10, value of digit of 1):
+roman_positions = (("m", None, None, 1000), ("c", "d", "m", 100),
+                   ("x", "l", "c", 10), ("i", "v", "x", 1))
+
+# Digit patterns of one position: {pattern state: {digit kind: (next
+# pattern state, added multiple of the unit)}}; e.g. "iv" is 1 for "i"
+# and 3 more for "v", "ix" is 1 and 8 more:
+roman_position_steps = {"": {1: ("1", 1), 5: ("5", 5)},
+                        "1": {1: ("2", 1), 5: ("end", 3), 10: ("end", 8)},
+                        "2": {1: ("3", 1)},
+                        "5": {1: ("6", 1)},
+                        "6": {1: ("7", 1)},
+                        "7": {1: ("8", 1)},
+                        "3": {}, "8": {}, "end": {}}
+
+
+def build_roman_grammar():
+    """Returns state machine of canonical Roman numerals of the 1:3999
+    range as list of dictionaries, one per state, {Roman digit: (next
+    state, value added by the digit)}; state 0 is the start. A sequence
+    of digits is a canonical numeral if every digit has a transition,
+    and its value is the sum of the added values."""
+
+    states = [(0, "")]  # (position index, pattern state)
+    state_ids = {(0, ""): 0}
+    transitions = []
+    for (position, pattern) in states:
+        state_transitions = {}
+        # the digit continues the pattern of the current position, or
+        # starts the pattern of any later one (skipped positions are 0):
+        for next_position in range(position, len(roman_positions)):
+            one, five, ten, unit = roman_positions[next_position]
+            steps = roman_position_steps[
+                pattern if next_position == position else ""]
+            for (kind, (next_pattern, added)) in steps.items():
+                digit = {1: one, 5: five, 10: ten}[kind]
+                if digit is None or digit in state_transitions:
+                    continue
+                next_state = (next_position, next_pattern)
+                if next_state not in state_ids:
+                    state_ids[next_state] = len(states)
+                    states.append(next_state)
+                state_transitions[digit] = (state_ids[next_state],
+                                            added * unit)
+        transitions.append(state_transitions)
+    return(transitions)
+
+
+roman_grammar = build_roman_grammar()
+
+# Number of numerals decoded by roman_to_int with roman_grammar before
+# it loads the conversion tables:
+ROMAN_DECODE_LIMIT = 256
+_roman_decodes = 0
+
+
+def roman_to_int(input_roman):
+    """Returns value of canonical Roman numeral of the 1:3999 range,
+    or None. The first ROMAN_DECODE_LIMIT numerals are decoded with
+    roman_grammar, so short runs do not load the conversion tables;
+    later ones are looked up in the tables of get_roman_tables."""
+
+    global _roman_decodes
+    if _roman_tables is None and _roman_decodes < ROMAN_DECODE_LIMIT:
+        _roman_decodes += 1
+        state = 0
+        out_number = 0
+        for digit in input_roman:
+            step = roman_grammar[state].get(digit)
+            if step is None:
+                return(None)
+            state, added = step
+            out_number += added
+        return(out_number)
+    return(get_roman_tables()[0].get(input_roman))
+
+
+class IntergalacticConverter:
+    """Converts Intergalactic numbers to integers using precomputed table
+    of canonical Roman numerals and cache of already converted numbers.
+    Results and error messages are the same as of intergalactic_to_int.
+    The dictionary should not be modified while the converter is used."""
+
+    def __init__(self, intergal_roman_dict):
+        self.intergal_roman_dict = intergal_roman_dict
+        # {tuple of Intergalactic numerals: integer}; only valid numbers
+        # are cached, so the cache size is bounded by the dictionary:
+        self.cache = {}
+        # {numeral: set of cached numbers containing it}, built on the
+        # first invalidate of a numeral, so that conversion does not
+        # maintain it unless numerals are invalidated:
+        self.keys_by_numeral = None
+        # integer -> Intergalactic number table of to_intergalactic,
+        # built on first use, and size of the dictionary it was built for:
+        self.intergalactic_table = None
+        self.intergalactic_table_size = 0
+
+    def to_int(self, intergalactic_number):
+        """Returns integer representation of the given
+        Intergalactic number (list or tuple of numerals)."""
+
+        key = tuple(intergalactic_number)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return(cached)
+
+        intergal_roman_dict = self.intergal_roman_dict
+        for numeral in key:
+            if numeral not in intergal_roman_dict:
+                raise ValueError(
+                    "intergalactic_to_int: intergalactic numeral \'{0}\' not "
+                    "found in intergal_roman_dict".format(numeral))
+
+        input_roman = "".join([intergal_roman_dict[x] for x in key])
+        if not input_roman:  # empty number, same as in intergalactic_to_int
+            return(0)
+        out_number = roman_to_int(input_roman)
+        if out_number is None:  # not a canonical Roman numeral
+            raise ValueError("input number should be in 1:3999 range")
+        self.cache[key] = out_number
+        if self.keys_by_numeral is not None:
+            self._index(key)
+        return(out_number)
+
+    def _index(self, key):
+        """Add the cached number to the index of numerals."""
+
+        keys_by_numeral = self.keys_by_numeral
+        for numeral in key:
+            keys_by_numeral.setdefault(numeral, set()).add(key)
+
+    def to_intergalactic(self, int_input):
+        """Returns Intergalactic number (tuple of numerals) of the integer
+        in 1:3999 range; same as int_to_intergalactic, but O(1) lookup in
+        table built once per dictionary. Numerals added to the dictionary
+        are taken into account."""
+
+        if (self.intergalactic_table is None or
+                self.intergalactic_table_size !=
+                len(self.intergal_roman_dict)):
+            self.intergalactic_table = build_intergalactic_table(
+                self.intergal_roman_dict)
+            self.intergalactic_table_size = len(self.intergal_roman_dict)
+
+        if not isinstance(int_input, int) or not 0 < int_input < 4000:
+            raise ValueError("number should be in 1:3999 range in "
+                             "int_to_intergalactic")
+        out_number = self.intergalactic_table[int_input]
+        if out_number is None:
+            raise ValueError("no Intergalactic numerals for number {0} in "
+                             "int_to_intergalactic".format(int_input))
+        return(out_number)
+
+    def invalidate(self, numeral=None):
+        """Drop cached conversions containing the given numeral
+        (all cached conversions if numeral is None). Should be called
+        when the numeral is removed from or changed in the dictionary."""
+
+        self.intergalactic_table = None
+        if numeral is None:
+            self.cache.clear()
+            self.keys_by_numeral = None
+            return
+        if self.keys_by_numeral is None:
+            self.keys_by_numeral = {}
+            for key in self.cache:
+                self._index(key)
+        keys_by_numeral = self.keys_by_numeral
+        for key in keys_by_numeral.pop(numeral, ()):
+            del self.cache[key]
+            for other in key:
+                keys = keys_by_numeral.get(other)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del keys_by_numeral[other]
+
+
+class NumeralDecoder(IntergalacticConverter):
+    """Converter compiled from the dictionary: every state of the Roman
+    numeral grammar (roman_grammar) gets a table {Intergalactic numeral:
+    (next state, value added)}, so an Intergalactic number is decoded and
+    validated in one left-to-right pass over its numerals, without Roman
+    strings. Results and error messages are the same as of
+    IntergalacticConverter; numerals added to the dictionary are compiled
+    on first use, and invalidate should be called when one is changed."""
+
+    def __init__(self, intergal_roman_dict):
+        super().__init__(intergal_roman_dict)
+        self.compile()
+
+    def compile(self):
+        """Build transition tables of the current dictionary."""
+
+        for (numeral, roman) in self.intergal_roman_dict.items():
+            if roman not in roman_to_arabic_digits:
+                raise ValueError("compile_decoder: \'{0}\' of numeral "
+                                 "\'{1}\' is not a Roman digit"
+                                 .format(roman, numeral))
+        self.transitions = [
+            {numeral: state_transitions[roman] for (numeral, roman)
+             in self.intergal_roman_dict.items()
+             if roman in state_transitions}
+            for state_transitions in roman_grammar]
+        self.compiled_size = len(self.intergal_roman_dict)
+
+    def to_int(self, intergalactic_number):
+        """Returns integer representation of the given
+        Intergalactic number (list or tuple of numerals)."""
+
+        transitions = self.transitions
+        state = 0
+        out_number = 0
+        for numeral in intergalactic_number:
+            step = transitions[state].get(numeral)
+            if step is None:
+                return(self._to_int_failed(intergalactic_number))
+            state, added = step
+            out_number += added
+        return(out_number)
+
+    def _to_int_failed(self, intergalactic_number):
+        """Raises ValueError of the number which has no transition;
+        the number is decoded again if the dictionary has grown."""
+
+        if len(self.intergal_roman_dict) != self.compiled_size:
+            self.compile()
+            return(self.to_int(intergalactic_number))
+        for numeral in intergalactic_number:
+            if numeral not in self.intergal_roman_dict:
+                raise ValueError(
+                    "intergalactic_to_int: intergalactic numeral \'{0}\' not "
+                    "found in intergal_roman_dict".format(numeral))
+        raise ValueError("input number should be in 1:3999 range")
+
+    def invalidate(self, numeral=None):
+        """Recompile the dictionary after the numeral is removed from or
+        changed in it."""
+
+        super().invalidate(numeral)
+        self.compile()
+
+
+def compile_decoder(intergal_roman_dict):
+    """Returns NumeralDecoder of the validated Intergalactic -> Roman
+    dictionary; it can be passed as converter to validate_price,
+    calculate_goods_prices and run_queries."""
+
+    return(NumeralDecoder(intergal_roman_dict))
+
+
+# Error codes of intergalactic_to_int_batch:
+BATCH_OK = 0
+BATCH_UNKNOWN_NUMERAL = 1  # numeral not found in intergal_roman_dict
+BATCH_INVALID_NUMBER = 2   # not a canonical Roman number in 1:3999 range
+
+# Roman symbols in order of digit codes used by intergalactic_to_int_batch;
+# code 0 is padding of the 2-D array:
+batch_roman_symbols = "ivxlcdm"
+
+# Lazily built NumPy tables of intergalactic_to_int_batch:
+_batch_tables = None
+
+
+def _load_numpy():
+    """Import numpy on first use; returns the module or None if numpy
+    is not installed."""
+
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return(None)
+        np = numpy
+    return(np)
+
+
+def _get_batch_tables():
+    """Returns NumPy tables (values of digit codes, canonical digit codes
+    of numbers 0:3999 padded to the longest canonical Roman numeral)."""
+
+    global _batch_tables
+    if _batch_tables is None:
+        roman_to_int_table, int_to_roman_table = get_roman_tables()
+        code_values = np.array(
+            [0] + [roman_to_arabic_digits[x] for x in batch_roman_symbols],
+            dtype=np.int32)
+        max_len = max(len(x) for x in roman_to_int_table)
+        canonical_codes = np.zeros((4000, max_len), dtype=np.int8)
+        for (int_number, roman) in int_to_roman_table.items():
+            canonical_codes[int_number, :len(roman)] = \
+                [batch_roman_symbols.index(x) + 1 for x in roman]
+        _batch_tables = (code_values, canonical_codes)
+    return(_batch_tables)
+
+
+def intergalactic_to_int_batch(intergalactic_numbers, intergal_roman_dict):
+    """Vectorized intergalactic_to_int for list of Intergalactic numbers
+    (lists of numerals). Returns tuple of NumPy arrays (integer values,
+    validity mask, error codes BATCH_*); values of invalid rows are 0.
+    Requires numpy."""
+
+    if _load_numpy() is None:
+        raise ImportError("numpy is required for intergalactic_to_int_batch")
+    code_values, canonical_codes = _get_batch_tables()
+
+    # Intergalactic numeral -> digit code; -1 for unknown numerals:
+    numeral_codes = {k: batch_roman_symbols.index(v) + 1
+                     for (k, v) in intergal_roman_dict.items()}
+    lengths = np.fromiter((len(x) for x in intergalactic_numbers),
+                          dtype=np.int64, count=len(intergalactic_numbers))
+    flat_codes = np.fromiter(
+        (numeral_codes.get(x, -1) for number in intergalactic_numbers
+         for x in number), dtype=np.int8, count=int(lengths.sum()))
+
+    # Padded 2-D array of digit codes, one row per number; rows are
+    # truncated to the longest canonical number (longer ones are invalid),
+    # so one long garbage row does not widen the whole array:
+    width = canonical_codes.shape[1]
+    codes = np.zeros((len(intergalactic_numbers), width), dtype=np.int8)
+    if int(lengths.max(initial=0)) <= width:
+        codes[np.arange(width) < lengths[:, None]] = flat_codes
+        unknown = (codes < 0).any(axis=1)
+    else:
+        row_ids = np.repeat(np.arange(len(intergalactic_numbers)), lengths)
+        positions = np.arange(len(flat_codes)) - \
+            np.repeat(np.cumsum(lengths) - lengths, lengths)
+        kept = positions < width
+        codes[row_ids[kept], positions[kept]] = flat_codes[kept]
+        # unknown numerals anywhere in the row, not only in its prefix:
+        unknown = np.bincount(row_ids[flat_codes < 0],
+                              minlength=len(intergalactic_numbers)) > 0
+    codes[codes < 0] = 0
+
+    # Subtractive sum: digit is subtracted if the next digit is larger:
+    values = code_values[codes]
+    next_values = np.zeros_like(values)
+    next_values[:, :-1] = values[:, 1:]
+    values = np.where(values < next_values, -values, values).sum(axis=1)
+
+    # Canonical form check against the precomputed table:
+    in_range = (values >= 0) & (values < 4000) & \
+        (lengths <= canonical_codes.shape[1])
+    canonical = np.zeros(len(values), dtype=bool)
+    canonical[in_range] = (
+        codes[in_range] == canonical_codes[values[in_range]]).all(axis=1)
+
+    errors = np.full(len(values), BATCH_OK, dtype=np.int8)
+    errors[~canonical] = BATCH_INVALID_NUMBER
+    errors[unknown] = BATCH_UNKNOWN_NUMERAL
+    valid = errors == BATCH_OK
+    return(np.where(valid, values, 0), valid, errors)
+
+
+def calculate_goods_prices(price_list, intergal_roman_dict, converter=None):
     """"Returns dictionary {name of good: price of good unit (float)}.
     If contradictory price entries exist, execution stops."""
 
+    if converter is None:
+        converter = IntergalacticConverter(intergal_roman_dict)
+
     goods_prices = {}
     for price_entry in price_list:
         if price_entry[-4] not in goods_prices:  # new good found in price_list
             good_name = price_entry[-4]
-            price_total = float(price_entry[-2])
+            price_total = parse_price(price_entry[-2])
             quantity_intergalactic = price_entry[0:-4]
-            quantity_int = intergalactic_to_int(quantity_intergalactic,
-                                                intergal_roman_dict)
+            quantity_int = converter.to_int(quantity_intergalactic)
             price_of_unit = price_total / quantity_int
             goods_prices[good_name] = price_of_unit
 
         else:  # the good already exist in the price list
             # Check whether the unit price is the same 
             # as in previous entry for the specified good.
-            price = float(price_entry[-2])
+            price_total = parse_price(price_entry[-2])
             quantity_intergalactic = price_entry[0:-4]
-            quantity_int = intergalactic_to_int(quantity_intergalactic,
-                                                intergal_roman_dict)
+            quantity_int = converter.to_int(quantity_intergalactic)
             price_of_unit = price_total / quantity_int
             if (price_of_unit == goods_prices[price_entry[-4]]):
                 continue  # the price is the same, do nothing
@@ -242,59 +1198,363 @@ def calculate_goods_prices(price_list, intergal_roman_dict):
     return(goods_prices)
 
 
-def run_queries(query_list, intergal_roman_dict, goods_prices):
-    """Determines type of query (number conversion or price query),
-       validate query and return query results and error messages"""
+def answer_number_query(query, goods_prices, converter):
+    """Returns result or error message of number conversion query."""
+
+    try:
+        out_number = converter.to_int(query.quantity)
+    except ValueError:
+        return("Invalid Intergalactic number \'{0}\' found in the query"
+               .format(" ".join(query.quantity)))
+    return(" ".join(query.quantity) + " is " + str(out_number))
+
+
+def answer_price_query(query, goods_prices, converter):
+    """Returns result or error message of price query."""
+
+    good = query.good
+    if good not in goods_prices:
+        return("No correct price found in input for good \'{0}\'"
+               .format(good.capitalize()))
+    try:
+        quantity_int = converter.to_int(query.quantity)
+    except ValueError:
+        return("Invalid Intergalactic number \'{0}\' found in the query"
+               .format(" ".join(query.quantity)))
+
+    price_out = format_credits(goods_prices[good], quantity_int)
+    return(" ".join(query.quantity) + " " + good.capitalize() +
+           " is " + price_out + " Credits")
+
+
+def answer_say_query(query, goods_prices, converter):
+    """Returns result or error message of integer -> Intergalactic
+    conversion query."""
+
+    number = query.quantity[0]
+    out_number = None
+    if number.isascii() and number.isdigit():  # no signs, "_" etc.
+        try:
+            out_number = converter.to_intergalactic(int(number))
+        except ValueError:  # out of range or no numerals for it
+            pass
+    if out_number is None:
+        return("Number \'{0}\' cannot be said in Intergalactic numerals"
+               .format(number))
+    return(number + " is " + " ".join(out_number))
+
+
+def answer_query(query, goods_prices, converter):
+    """Returns result or error message of the QueryLine record."""
+
+    answer = query_answerers.get(query.kind)
+    if answer is None:  # unrecognized query type
+        return("I have no idea what you are talking about")
+    return(answer(query, goods_prices, converter))
+
+
+# Built-in query forms:
+# "how much is <Intergalactic number> ?"
+register_query_form(("how", "much", "is"), "number",
+                    lambda words, n: (words[n:-1], None),
+                    answer_number_query)
+# "how many credits is <Intergalactic number> <good> ?"
+register_query_form(("how", "many", "credits", "is"), "price",
+                    lambda words, n: (words[n:-2], words[-2]),
+                    answer_price_query)
+# "how do i say <integer> ?"
+register_query_form(("how", "do", "i", "say"), "say",
+                    lambda words, n: (words[n:n + 1], None)
+                    if len(words) == n + 2 else None,
+                    answer_say_query)
+
+
+class AnswerCache:
+    """Bounded LRU cache {QueryLine record: answer} with hit, miss and
+    eviction counters. Cached answers depending on a numeral or good
+    should be invalidated when the numeral or the good price changes."""
+
+    def __init__(self, max_size=65536):
+        if max_size < 1:
+            raise ValueError("max_size should be positive in AnswerCache")
+        self.max_size = max_size
+        self.answers = OrderedDict()
+        # {numeral or good: set of cached queries containing it} and set
+        # of cached "say" queries, so invalidation does not scan the cache;
+        # built on the first invalidate of a name, so that caching does not
+        # maintain them unless names are invalidated (e.g. in batch mode):
+        self.queries_by_name = None
+        self.say_queries = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, query):
+        """Returns cached answer of the query or None."""
+
+        answer = self.answers.get(query)
+        if answer is None:
+            self.misses += 1
+            return(None)
+        self.answers.move_to_end(query)  # most recently used
+        self.hits += 1
+        return(answer)
+
+    def put(self, query, answer):
+        """Cache the answer, evicting the least recently used one
+        if the cache is full."""
+
+        answers = self.answers
+        if self.queries_by_name is not None and query not in answers:
+            self._index(query)
+        answers[query] = answer
+        if len(answers) > self.max_size:
+            old_query, _ = answers.popitem(last=False)
+            if self.queries_by_name is not None:
+                self._unindex(old_query)
+            self.evictions += 1
+
+    def _index(self, query):
+        """Add the query to the index of names."""
+
+        if query.kind == "say":
+            self.say_queries.add(query)
+            return
+        queries_by_name = self.queries_by_name
+        for name in query.quantity:
+            queries_by_name.setdefault(name, set()).add(query)
+        if query.good is not None:
+            queries_by_name.setdefault(query.good, set()).add(query)
+
+    def _unindex(self, query):
+        """Remove the query from the index of names."""
+
+        if query.kind == "say":
+            self.say_queries.discard(query)
+            return
+        queries_by_name = self.queries_by_name
+        for name in (query.quantity if query.good is None
+                     else query.quantity + (query.good,)):
+            queries = queries_by_name.get(name)
+            if queries is not None:
+                queries.discard(query)
+                if not queries:
+                    del queries_by_name[name]
+
+    def invalidate(self, name=None):
+        """Drop cached answers of queries containing numeral or good
+        with the given name (all cached answers if name is None).
+        Answers of "say" queries depend on the whole dictionary,
+        so they are dropped on any change."""
+
+        if name is None:
+            self.answers.clear()
+            self.queries_by_name = None
+            self.say_queries = None
+            return
+        answers = self.answers
+        if self.queries_by_name is None:
+            self.queries_by_name = {}
+            self.say_queries = set()
+            for query in answers:
+                self._index(query)
+        for query in self.say_queries:
+            del answers[query]
+        self.say_queries.clear()
+        for query in self.queries_by_name.pop(name, ()):
+            del answers[query]
+            self._unindex(query)
+
+    def stats(self):
+        """Returns dictionary of cache counters."""
+
+        return({"size": len(self.answers), "max_size": self.max_size,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions})
+
+
+def run_queries(query_list, intergal_roman_dict, goods_prices,
+                converter=None, answer_cache=None):
+    """Determines type of query (number conversion, price query or
+       integer -> Intergalactic conversion),
+       validate query and return query results and error messages.
+       Queries can be given as lists of words or QueryLine records.
+       Repeated queries are answered from answer_cache if given."""
+
+    if converter is None:
+        converter = IntergalacticConverter(intergal_roman_dict)
 
     out_txt = []
     for query in query_list:
-        if query[0:3] == ["how", "much", "is"]:  # number conversion
-            try:
-                out_number = intergalactic_to_int(query[3:-1],
-                                                  intergal_roman_dict)
-                out_txt.append(" ".join(query[3:-1]) +
-                               " is " + str(out_number))
-            except ValueError:
-                error_message = "Invalid Intergalactic number \'{0}\' found "\
-                                "in the query".format(" ".join(query[3:-1]))
-                out_txt.append(error_message)
-
-        elif query[0:4] == ["how", "many", "credits", "is"]:  # price query
-            unpriced_goods = not_in_dict([query[-2]], goods_prices)
-            if unpriced_goods != [""]:
-                error_message =\
-                    "No correct price found in input for good \'{0}\'"\
-                    .format(", ".join([x.capitalize()
-                            for x in unpriced_goods]))
-                out_txt.append(error_message)
-                continue
-            try:
-                good = query[-2]
-                quantity_intergalactic = query[4:-2]
-                price_total = goods_prices[good] * intergalactic_to_int(
-                    quantity_intergalactic, intergal_roman_dict)
-
-                if price_total % 1 == 0:  # integer price
-                    price_out = str(int(price_total))
-                else:
-                    price_out = "{:.4f}".format(price_total)
-
-                out_txt.append(" ".join(quantity_intergalactic) + " " +
-                               good.capitalize() + " is " +
-                               price_out + " Credits")
-            except ValueError:
-                error_message =\
-                    "Invalid Intergalactic number \'{0}\' found in "\
-                    "the query".format(" ".join(query[4:-2]))
-                out_txt.append(error_message)
-
-        else:  # unrecognized query type
-            err_msg_query = "I have no idea what you are talking about"
-            out_txt.append(err_msg_query)
+        if not isinstance(query, QueryLine):
+            query = parse_query(tuple(query))
+        if answer_cache is None:
+            out_txt.append(answer_query(query, goods_prices, converter))
+            continue
+        answer = answer_cache.get(query)
+        if answer is None:
+            answer = answer_query(query, goods_prices, converter)
+            answer_cache.put(query, answer)
+        out_txt.append(answer)
+
+    return(out_txt)
+
+
+# Tables of the query worker process, set once by _init_query_worker:
+_worker_tables = None
+
+
+def _init_query_worker(intergal_roman_dict, goods_prices, answer_cache_size):
+    """Initializer of the query worker process: keeps the tables
+    shipped to the worker for all the chunks it executes."""
+
+    global _worker_tables
+    answer_cache = AnswerCache(answer_cache_size) \
+        if answer_cache_size else None
+    _worker_tables = (intergal_roman_dict, goods_prices,
+                      IntergalacticConverter(intergal_roman_dict),
+                      answer_cache)
+
+
+def _run_queries_chunk(query_chunk):
+    """Execute chunk of queries in the query worker process."""
+
+    intergal_roman_dict, goods_prices, converter, answer_cache = \
+        _worker_tables
+    return(run_queries(query_chunk, intergal_roman_dict, goods_prices,
+                       converter, answer_cache))
+
+
+def run_queries_as_of(query_list, line_numbers, price_history,
+                      converter, answer_cache=None):
+    """Same as run_queries for QueryLine records on the given line
+    numbers, but price queries are answered with the unit price of the
+    good as of the line of the query in PriceHistory. Answers of price
+    queries are not cached, since they depend on the line."""
+
+    out_txt = []
+    for (query, line_number) in zip(query_list, line_numbers):
+        if query.kind == "price":
+            unit_price = price_history.price_at(query.good, line_number)
+            out_txt.append(answer_query(
+                query, {} if unit_price is None else
+                {query.good: unit_price}, converter))
+            continue
+        if answer_cache is None:
+            out_txt.append(answer_query(query, {}, converter))
+            continue
+        answer = answer_cache.get(query)
+        if answer is None:
+            answer = answer_query(query, {}, converter)
+            answer_cache.put(query, answer)
+        out_txt.append(answer)
+    return(out_txt)
+
+
+def run_queries_parallel(query_list, intergal_roman_dict, goods_prices,
+                         workers=None, chunk_size=10000, answer_cache_size=0):
+    """Same as run_queries, but queries are split into chunks of chunk_size
+    executed by pool of worker processes (by default one per CPU core).
+    Results are returned in the order of query_list. If answer_cache_size
+    is not 0, every worker keeps its own AnswerCache of this size."""
 
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be positive in "
+                         "run_queries_parallel")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    chunks = [query_list[i:i + chunk_size]
+              for i in range(0, len(query_list), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:  # nothing to parallelize
+        answer_cache = AnswerCache(answer_cache_size) \
+            if answer_cache_size else None
+        return(run_queries(query_list, intergal_roman_dict, goods_prices,
+                           answer_cache=answer_cache))
+
+    out_txt = []
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                             initializer=_init_query_worker,
+                             initargs=(intergal_roman_dict, goods_prices,
+                                       answer_cache_size)) as executor:
+        # executor.map returns chunk results in the order of chunks:
+        for chunk_out in executor.map(_run_queries_chunk, chunks):
+            out_txt.extend(chunk_out)
     return(out_txt)
 
 
+# Compiled catalog file format: magic, version byte, SHA-256 key
+# of the definition lines and marshalled tables.
+CATALOG_MAGIC = b"MGCAT"
+CATALOG_VERSION = 4
+
+
+def catalog_key(dict_list, price_list, reprice=False):
+    """Returns SHA-256 digest of dictionary and price lines (and of
+    the reprice option of main), used as a key of the compiled catalog."""
+
+    import hashlib
+
+    key_hash = hashlib.sha256()
+    for line_list in (dict_list, price_list):
+        for words in line_list:
+            key_hash.update(" ".join(words).encode("utf-8") + b"\n")
+        key_hash.update(b"\0")  # separates dictionary and price sections
+    if reprice:  # prices are calculated in other way
+        key_hash.update(b"reprice")
+    return(key_hash.digest())
+
+
+def save_catalog(path, key, intergal_roman_dict, goods_prices, rejected,
+                 line_numbers=None):
+    """Write compiled catalog: dictionary, prices and rejected
+    definition lines (Rejected records), keyed by catalog_key
+    of the definition lines. If line_numbers of the definition lines
+    (in the order of catalog_key) are given, line numbers of rejected
+    records are saved as indices in it, so they do not depend on
+    positions of the definition lines in the input."""
+
+    if line_numbers is not None:
+        line_indices = {x: i for (i, x) in enumerate(line_numbers)}
+        rejected = [x._replace(line_number=line_indices.get(x.line_number))
+                    for x in rejected]
+    payload = marshal.dumps((intergal_roman_dict, goods_prices,
+                             [tuple(x) for x in rejected]))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CATALOG_MAGIC + bytes([CATALOG_VERSION]) + key + payload)
+    os.replace(tmp_path, path)  # readers never see partially written file
+
+
+def load_catalog(path, key, line_numbers=None):
+    """Returns tuple (intergal_roman_dict, goods_prices, rejected) from
+    compiled catalog, or None if the catalog does not exist, has other
+    format version or was compiled from other definition lines.
+    line_numbers should be given if they were given to save_catalog;
+    they are line numbers of the definition lines of the current input."""
+
+    header = CATALOG_MAGIC + bytes([CATALOG_VERSION]) + key
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return(None)
+    if not data.startswith(header):
+        return(None)
+    try:
+        intergal_roman_dict, goods_prices, rejected = \
+            marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):  # damaged catalog file
+        return(None)
+    rejected = [Rejected(*x) for x in rejected]
+    if line_numbers is not None:
+        rejected = [x._replace(line_number=line_numbers[x.line_number])
+                    if x.line_number is not None else x for x in rejected]
+    return(intergal_roman_dict, goods_prices, rejected)
+
+
 def write_out(workdir, file_name, out_txt):
     """Write output to 'file_name' file in workdir directory"""
 
@@ -303,42 +1563,471 @@ def write_out(workdir, file_name, out_txt):
     pass
 
 
-def main(workdir=""):
-    """Entry point to the app"""
+def open_out(workdir, file_name, compression=None, buffer_size=1 << 16):
+    """Open 'file_name' file in workdir directory for writing text.
+    With compression (key of output_compressors), the file is compressed
+    and the suffix of the compression is added to the file name.
+    Returns the file object."""
+
+    path = os.path.join(workdir, file_name)
+    if compression is None:
+        return(open(path, "w", encoding="utf-8", buffering=buffer_size))
+    if compression not in output_compressors:
+        raise ValueError("compression '{0}' is not available, use one of: "
+                         "{1}".format(compression,
+                                      ", ".join(output_compressors)))
+    import importlib
+
+    module_name, suffix = output_compressors[compression]
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        raise ValueError("compression '{0}' is not available in this Python"
+                         .format(compression))
+    return(module.open(path + suffix, "wt", encoding="utf-8"))
+
+
+def write_lines(workdir, file_name, lines, compression=None,
+                chunk_lines=4096, buffer_size=1 << 16):
+    """Same as write_out, but lines (any iterable, e.g. generator
+    formatting the lines on the fly) are joined and written in chunks
+    of chunk_lines lines through buffer of buffer_size bytes, so the
+    whole file is never held in memory. Without compression, the file
+    is identical to the file written by write_out."""
+
+    lines = iter(lines)
+    with open_out(workdir, file_name, compression, buffer_size) as f:
+        chunk = list(islice(lines, chunk_lines))
+        f.write("\n".join(chunk))
+        while chunk:
+            chunk = list(islice(lines, chunk_lines))
+            if chunk:  # lines are separated by newlines, as in write_out
+                f.write("\n")
+                f.write("\n".join(chunk))
+
+
+def process_line(line, intergal_roman_dict, goods_prices, converter,
+                 answer_cache=None, reprice=False):
+    """Process single input line. Dictionary and price lines update
+    intergal_roman_dict and goods_prices in place (and invalidate answers
+    in answer_cache depending on them). Returns tuple
+    ("output.txt", query result) or ("errors.txt", rejected line),
+    or None for empty and accepted definition lines.
+    If the line contradicts the previous entries, execution stops
+    and the tables are not changed; with reprice, a price line with other
+    unit price of a known good re-prices the good instead."""
+
+    record = classify_record(line)
+
+    if record is None:
+        return(None)  # skip empty lines
+
+    return(process_record(record, intergal_roman_dict, goods_prices,
+                          converter, answer_cache, reprice))
+
+
+def process_record(record, intergal_roman_dict, goods_prices, converter,
+                   answer_cache=None, reprice=False):
+    """Same as process_line for record returned by classify_record."""
+
+    record_type = type(record)
+
+    if record_type is DictLine:
+        dict_out, rejected = validate_dict_records([record], [])
+        if rejected:
+            return("errors.txt", format_rejected(rejected[0]))
+        known_roman = intergal_roman_dict.get(record.numeral)
+        if known_roman is None:  # new numeral
+            intergal_roman_dict[record.numeral] = record.roman
+            if answer_cache is not None:
+                answer_cache.invalidate(record.numeral)
+        elif known_roman != record.roman:
+            raise SystemExit("Contradicting entries in input dictionary!")
+        return(None)
+
+    if record_type is PriceLine:
+        price_out, rejected = validate_price_records([record], [], converter)
+        if rejected:
+            return("errors.txt", format_rejected(rejected[0]))
+        price_of_unit = exact_unit_price(record.price,
+                                         converter.to_int(record.quantity))
+        known_price = goods_prices.get(record.good)
+        if known_price is None or (reprice and known_price != price_of_unit):
+            # new good, or new price of the good
+            goods_prices[record.good] = price_of_unit
+            if answer_cache is not None:
+                answer_cache.invalidate(record.good)
+        elif known_price != price_of_unit:
+            raise SystemExit("Contradicting entries in input prices!")
+        return(None)
+
+    if record_type is QueryLine:
+        return("output.txt", run_queries([record], intergal_roman_dict,
+                                          goods_prices, converter,
+                                          answer_cache)[0])
+
+    return("errors.txt", format_rejected(record))
+
+
+def process_stream(lines, answer_cache=None, reprice=False):
+    """Generator processing input lines one by one. Yields tuples
+    ("output.txt", query result) and ("errors.txt", rejected line).
+    Queries are answered using dictionary and prices defined by the
+    preceding lines only. If contradictory entries exist, execution stops
+    (with reprice, later price lines re-price goods)."""
+
+    intergal_roman_dict = {}
+    goods_prices = {}
+    # Cached conversions stay valid when the dictionary grows, since
+    # redefinition of a numeral to another Roman symbol stops execution:
+    converter = IntergalacticConverter(intergal_roman_dict)
+
+    for line in lines:
+        result = process_line(line, intergal_roman_dict, goods_prices,
+                              converter, answer_cache, reprice)
+        if result is not None:
+            yield(result)
+
+
+class StageStats:
+    """Metrics of the stages of main(): wall time, numbers of processed
+    items and rejected lines, and change of the number of memory blocks
+    allocated by the interpreter (sys.getallocatedblocks)."""
+
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name):
+        """Returns context manager measuring the stage; items and
+        rejected counts are set as attributes of the context object."""
+
+        return(_StageTimer(self, name))
+
+    def to_dict(self):
+        """Returns metrics as dictionary {stage name: metrics}."""
+
+        return({x["stage"]: {k: v for (k, v) in x.items() if k != "stage"}
+                for x in self.stages})
+
+    def to_json(self):
+        """Returns metrics as JSON text."""
 
-    # Read input file:
-    input_text = read_input(workdir)
+        import json
 
-    # Sort lines of the input to dictionary, prices, queries and unrecognized:
-    dict_list, price_list, query_list, unknown_list = sort_lines(input_text)
+        return(json.dumps(self.stages, indent=2))
 
-    # Validate dictionary lines:
-    dict_list, unknown_list = validate_dict(dict_list, unknown_list)
+    def to_prometheus(self, prefix="merchants_guide"):
+        """Returns metrics in Prometheus text exposition format."""
 
-    # Create Intergalactic numeral -> Roman Numeral dictionary:
-    intergal_roman_dict = create_intergal_roman_dict(dict_list)
+        metrics = [("seconds", "Wall time of the stage"),
+                   ("items", "Number of items processed by the stage"),
+                   ("rejected", "Number of lines rejected by the stage"),
+                   ("allocated_blocks",
+                    "Change of allocated memory blocks during the stage")]
+        out_txt = []
+        for (metric, help_text) in metrics:
+            name = "{0}_stage_{1}".format(prefix, metric)
+            out_txt.append("# HELP {0} {1}".format(name, help_text))
+            out_txt.append("# TYPE {0} gauge".format(name))
+            for stage in self.stages:
+                out_txt.append("{0}{{stage=\"{1}\"}} {2}".format(
+                    name, stage["stage"], stage[metric]))
+        return("\n".join(out_txt) + "\n")
 
-    # Validate price lines:
-    price_list, unknown_list = validate_price(price_list, unknown_list,
-                                              intergal_roman_dict)
-   
-    # Calculate unit prices for all goods with valid price lines:
-    goods_prices = calculate_goods_prices(price_list, intergal_roman_dict)
+
+class _StageTimer:
+    """Context manager adding metrics of one stage to StageStats."""
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.items = 0
+        self.rejected = 0
+
+    def __enter__(self):
+        self.blocks = sys.getallocatedblocks()
+        self.start = time.perf_counter()
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        self.stats.stages.append({
+            "stage": self.name, "seconds": seconds, "items": self.items,
+            "rejected": self.rejected,
+            "allocated_blocks": sys.getallocatedblocks() - self.blocks})
+        return(False)
+
+
+class _NoStage:
+    """Context manager used instead of _StageTimer when main() runs
+    without StageStats: does nothing and ignores the counts."""
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return(False)
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_no_stage = _NoStage()
+
+
+def _no_stats_stage(name):
+    """Stage context of disabled instrumentation."""
+
+    return(_no_stage)
+
+
+def main_stream(workdir="", answer_cache=None, reader=iter_input,
+                compression=None, reprice=False):
+    """Streaming entry point to the app: input.txt is processed line by line
+    and results are written to output.txt and errors.txt incrementally,
+    in the same file format as by main(). Lines are read by the reader
+    (iter_input or iter_input_mmap); output files are compressed with
+    the compression as in open_out. With reprice, price lines re-price
+    goods as in process_stream."""
+
+    with open_out(workdir, "output.txt", compression) as out_file, \
+         open_out(workdir, "errors.txt", compression) as err_file:
+        first_output = True
+        for (file_name, text) in process_stream(reader(workdir),
+                                                answer_cache, reprice):
+            if file_name == "output.txt":
+                # query results are separated by newlines:
+                out_file.write(text if first_output else "\n" + text)
+                first_output = False
+            else:
+                err_file.write(text + "\n")
+        err_file.write("\n")  # errors.txt ends with an empty line
+
+    return(0)
+
+
+def main(workdir="", stream=False, workers=1, chunk_size=10000,
+         catalog=None, answer_cache_size=65536, stats=None,
+         mmap_input=False, compression=None, errors_format="text",
+         reprice=False):
+    """Entry point to the app. With workers other than 1, queries
+    are executed by run_queries_parallel (workers=None: one worker
+    per CPU core); the streaming mode is always single-process.
+    If catalog file name is given, dictionary and prices are loaded
+    from the compiled catalog, or compiled and saved to it.
+    Answers of repeated queries are cached in LRU cache of
+    answer_cache_size entries (0: no cache).
+    If StageStats object is given, metrics of the stages are added to it.
+    With mmap_input, input.txt is read from memory-mapped file.
+    Output files are compressed with the compression as in open_out.
+    Rejected lines are written in errors_format as by render_rejected;
+    the streaming mode writes only "text" format.
+    With reprice, goods re-priced by later price lines do not stop as
+    contradictions: price queries are answered with the unit price as
+    of their line (PriceHistory), in one process, as in the streaming
+    mode."""
+
+    stage = stats.stage if stats is not None else _no_stats_stage
+
+    answer_cache = AnswerCache(answer_cache_size) \
+        if answer_cache_size else None
+    reader = iter_input_mmap if mmap_input else iter_input
+
+    if stream:
+        if errors_format != "text":
+            raise ValueError("streaming mode writes only text errors format")
+        with stage("process_stream"):
+            return(main_stream(workdir, answer_cache, reader, compression,
+                               reprice))
+
+    # Read input file line by line and classify the lines into
+    # dictionary, price, query and rejected records (the app runs
+    # in one thread, so it can disable the garbage collector):
+    with stage("read_classify") as s:
+        query_line_numbers = [] if reprice else None
+        dict_records, price_records, query_records, rejected = \
+            classify_records(reader(workdir), True, query_line_numbers)
+        s.items = len(dict_records) + len(price_records) + \
+            len(query_records) + len(rejected)
+        s.rejected = len(rejected)
+
+    # Load dictionary and prices from the compiled catalog if it exists
+    # and was compiled from the same dictionary and price lines (at any
+    # positions in the input: line numbers of rejected definition lines
+    # are mapped to the current ones):
+    tables = None
+    if catalog is not None:
+        with stage("load_catalog") as s:
+            catalog_path = os.path.join(workdir, catalog)
+            key = catalog_key([x.words for x in dict_records],
+                              [x.words for x in price_records], reprice)
+            line_numbers = [x.line_number for x in
+                            chain(dict_records, price_records)]
+            tables = load_catalog(catalog_path, key, line_numbers)
+            s.items = len(dict_records) + len(price_records)
+
+    if tables is not None:
+        intergal_roman_dict, goods_prices, catalog_rejected = tables
+        rejected.extend(catalog_rejected)
+        converter = IntergalacticConverter(intergal_roman_dict)
+
+        # History of prices depends on positions of the price lines,
+        # so it is built again (rejected lines are already known):
+        if reprice:
+            with stage("price_history") as s:
+                s.items = len(price_records)
+                price_history = PriceHistory.from_records(
+                    validate_price_records(price_records, [], converter)[0],
+                    converter)
+
+    else:
+        rejected_count = len(rejected)
+
+        # Validate dictionary lines:
+        with stage("validate_dict") as s:
+            s.items = dict_count = len(dict_records)
+            dict_records, rejected = validate_dict_records(dict_records,
+                                                           rejected)
+            s.rejected = dict_count - len(dict_records)
+
+        # Create Intergalactic numeral -> Roman Numeral dictionary:
+        with stage("create_intergal_roman_dict") as s:
+            intergal_roman_dict = create_dict_from_records(dict_records)
+            s.items = len(dict_records)
+
+        # Conversion engine with cache shared by all the following stages:
+        converter = IntergalacticConverter(intergal_roman_dict)
+
+        # Validate price lines:
+        with stage("validate_price") as s:
+            s.items = price_count = len(price_records)
+            price_records, rejected = validate_price_records(
+                price_records, rejected, converter)
+            s.rejected = price_count - len(price_records)
+
+        # Calculate unit prices for all goods with valid price lines:
+        with stage("calculate_goods_prices") as s:
+            if reprice:
+                price_history = PriceHistory.from_records(price_records,
+                                                          converter)
+                goods_prices = price_history.goods_prices()
+            else:
+                goods_prices = calculate_prices_from_records(price_records,
+                                                             converter)
+            s.items = len(price_records)
+
+        if catalog is not None:
+            with stage("save_catalog"):
+                save_catalog(catalog_path, key, intergal_roman_dict,
+                             goods_prices, rejected[rejected_count:],
+                             line_numbers)
 
     # Execute queries:
-    out_txt = run_queries(query_list, intergal_roman_dict, goods_prices)
+    with stage("run_queries") as s:
+        if reprice:
+            out_txt = run_queries_as_of(query_records, query_line_numbers,
+                                        price_history, converter,
+                                        answer_cache)
+        elif workers == 1:
+            out_txt = run_queries(query_records, intergal_roman_dict,
+                                  goods_prices, converter, answer_cache)
+        else:
+            out_txt = run_queries_parallel(query_records,
+                                           intergal_roman_dict, goods_prices,
+                                           workers, chunk_size,
+                                           answer_cache_size)
+        s.items = len(query_records)
+
+    with stage("write_out") as s:
+        # Write query responces to the output.txt file: 
+        write_lines(workdir, "output.txt", out_txt, compression)
+
+        # Write erroneous input lines with error messages to errors.txt,
+        # formatting them chunk by chunk:
+        write_lines(workdir, "errors.txt",
+                    render_rejected(rejected, errors_format), compression)
+        s.items = len(out_txt) + len(rejected)
 
-    # Write query responces to the output.txt file: 
-    write_out(workdir, "output.txt", out_txt)
+    return(0)
 
-    # Write erroneous input lines with error messages to the errors.txt file:
-    merged_unknown_list = [" ".join(x) for x in unknown_list] + ["\n"]
-    write_out(workdir, "errors.txt", merged_unknown_list)
 
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Merchant's guide to the galaxy")
+    parser.add_argument("workdir", nargs="?", default="",
+                        help="directory containing input.txt "
+                             "(default: current directory)")
+    parser.add_argument("--stream", action="store_true",
+                        help="process input line by line with bounded "
+                             "memory; queries see only preceding definitions")
+    parser.add_argument("--build-tables", action="store_true",
+                        help="write frozen conversion tables file "
+                             "roman_tables.bin next to main.py and exit")
+    parser.add_argument("--mmap", action="store_true",
+                        help="read input.txt from memory-mapped file")
+    parser.add_argument("--compress", default=None,
+                        choices=sorted(output_compressors),
+                        help="compress output.txt and errors.txt")
+    parser.add_argument("--errors-format", default="text",
+                        choices=errors_formats,
+                        help="format of errors.txt: error messages, JSON "
+                             "lines or counts of reason codes "
+                             "(default: text)")
+    parser.add_argument("--reprice", action="store_true",
+                        help="later price lines re-price goods instead of "
+                             "contradicting the earlier ones")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes executing queries "
+                             "(0: one per CPU core; default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="number of queries per worker task "
+                             "(default: 10000)")
+    parser.add_argument("--catalog", default=None,
+                        help="compiled catalog file (relative to workdir) "
+                             "caching dictionary and prices between runs")
+    parser.add_argument("--answer-cache", type=int, default=65536,
+                        help="size of LRU cache of answers to repeated "
+                             "queries (0: no cache, faster for inputs with "
+                             "few repeated queries; default: 65536)")
+    parser.add_argument("--stats", default=None,
+                        help="write metrics of the stages to the file")
+    parser.add_argument("--stats-format", default="json",
+                        choices=["json", "prometheus"],
+                        help="format of the metrics file (default: json)")
+    return(parser.parse_args(argv))
+
+
+def run_cli(argv=None):
+    """Run the app with command line arguments (default: sys.argv[1:]);
+    returns exit code. A lone working directory (or no arguments) is
+    run without parsing the options, so argparse is not imported."""
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) <= 1 and not (argv and argv[0].startswith("-")):
+        return(main(argv[0] if argv else ""))
+
+    args = parse_args(argv)
+    if args.build_tables:
+        save_roman_tables()
+        return(0)
+    stats = StageStats() if args.stats is not None else None
+    main(args.workdir, stream=args.stream,
+         workers=args.workers or None, chunk_size=args.chunk_size,
+         catalog=args.catalog, answer_cache_size=args.answer_cache,
+         stats=stats, mmap_input=args.mmap, compression=args.compress,
+         errors_format=args.errors_format, reprice=args.reprice)
+    if stats is not None:
+        with open(args.stats, "w", encoding="utf-8") as f:
+            f.write(stats.to_json() if args.stats_format == "json"
+                    else stats.to_prometheus())
     return(0)
 
 
 if __name__ == "__main__":
     """ The code is executed from the command line """
-    main()
-
+    sys.exit(run_cli())
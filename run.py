@@ -0,0 +1,21 @@
+"""
+Fast launcher of MERCHANT'S GUIDE TO THE GALAXY with the same command
+line as main.py: python run.py [WORKDIR] [options]
+A script run directly is compiled on every start, while an imported
+module is loaded from its cached bytecode (__pycache__), so starting
+through this launcher saves compiling main.py on every run.
+"""
+
+import gc
+import sys
+
+# Objects created by the import live until the exit, so the garbage
+# collector is not run during the import, and they are moved out of its
+# generations (gc.freeze) afterwards:
+gc.disable()
+from main import run_cli
+gc.freeze()
+gc.enable()
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
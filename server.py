@@ -0,0 +1,157 @@
+"""
+Long-running local query server for MERCHANT'S GUIDE TO THE GALAXY.
+The server keeps Intergalactic -> Roman dictionary and goods prices
+in memory, shared by all the clients. Line protocol over TCP or Unix
+socket: every non-empty line sent by a client is processed as a line
+of input.txt, and exactly one response line is returned:
+1) query: query result in the same format as in output.txt
+2) rejected line: the line with error message as in errors.txt
+3) accepted dictionary or price line: "OK"
+4) contradicting dictionary or price line: error message
+5) line longer than the line limit: rejection message (the line is
+skipped, the connection is kept)
+Clients may send many lines without waiting for the responses
+(pipelining); responses come in the order of the lines.
+"""
+
+import argparse
+import asyncio
+
+from main import AnswerCache, IntergalacticConverter, process_line
+
+# Response to a line longer than the line limit of the stream:
+long_line_message = "REJECTED: line longer than {0} bytes"
+
+
+async def read_line(reader):
+    """Returns next line of asyncio StreamReader (bytes; b"" at end of
+    stream), or None for a line longer than the limit of the reader,
+    which is skipped up to and including its newline."""
+
+    try:
+        return(await reader.readuntil(b"\n"))
+    except asyncio.IncompleteReadError as err:  # last line without newline
+        return(err.partial)
+    except asyncio.LimitOverrunError:
+        pass
+    # drop the buffered part of the long line until its newline:
+    while True:
+        try:
+            await reader.readuntil(b"\n")
+            return(None)
+        except asyncio.IncompleteReadError:
+            return(None)
+        except asyncio.LimitOverrunError as err:
+            await reader.readexactly(err.consumed)
+
+
+class QueryServer:
+    """Dictionary and prices kept in memory, updated by definition
+    lines and used for queries of all the connected clients."""
+
+    def __init__(self, answer_cache_size=65536, line_limit=1 << 16):
+        self.intergal_roman_dict = {}
+        self.line_limit = line_limit
+        self.goods_prices = {}
+        self.converter = IntergalacticConverter(self.intergal_roman_dict)
+        self.answer_cache = AnswerCache(answer_cache_size) \
+            if answer_cache_size else None
+
+    def preload(self, path):
+        """Process lines of the file (e.g. input.txt with definitions)
+        before serving the clients. Query results are discarded."""
+
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                self.respond(line)
+
+    def respond(self, line):
+        """Returns response line (without newline) for the input line,
+        or None for empty line."""
+
+        if not line.strip():
+            return(None)
+        try:
+            result = process_line(line, self.intergal_roman_dict,
+                                  self.goods_prices, self.converter,
+                                  self.answer_cache)
+        except SystemExit as err:  # contradiction; tables are not changed
+            return(str(err))
+        if result is None:
+            return("OK")
+        return(result[1])
+
+    async def handle_client(self, reader, writer):
+        """Serve one client connection until it is closed."""
+
+        try:
+            while True:
+                line = await read_line(reader)
+                if line is None:
+                    response = long_line_message.format(self.line_limit)
+                elif not line:  # connection closed by the client
+                    break
+                else:
+                    response = self.respond(line.decode("utf-8", "replace"))
+                if response is not None:
+                    writer.write(response.encode("utf-8") + b"\n")
+                    # wait only if the client does not read responses:
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765, unix_path=None):
+        """Start listening; returns asyncio server object."""
+
+        if unix_path is not None:
+            return(await asyncio.start_unix_server(self.handle_client,
+                                                   path=unix_path,
+                                                   limit=self.line_limit))
+        return(await asyncio.start_server(self.handle_client, host, port,
+                                          limit=self.line_limit))
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None, preload=None,
+                answer_cache_size=65536, line_limit=1 << 16):
+    """Run the query server until it is cancelled."""
+
+    query_server = QueryServer(answer_cache_size, line_limit)
+    if preload is not None:
+        query_server.preload(preload)
+    server = await query_server.start(host, port, unix_path)
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(
+        description="Merchant's guide to the galaxy: query server")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="TCP host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="TCP port (default: 8765)")
+    parser.add_argument("--unix", default=None,
+                        help="listen on Unix socket path instead of TCP")
+    parser.add_argument("--preload", default=None,
+                        help="input file with definitions to load at start")
+    parser.add_argument("--answer-cache", type=int, default=65536,
+                        help="size of LRU cache of answers to repeated "
+                             "queries (0: no cache; default: 65536)")
+    parser.add_argument("--line-limit", type=int, default=1 << 16,
+                        help="longest line in bytes; longer lines are "
+                             "rejected (default: 65536)")
+    return(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    """ The server is started from the command line """
+    args = parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.preload,
+                          args.answer_cache, args.line_limit))
+    except KeyboardInterrupt:
+        pass
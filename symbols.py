@@ -0,0 +1,211 @@
+"""
+Compact interned representation of queries, numerals and goods.
+Names of numerals and goods are mapped to small integer IDs by
+SymbolTable. QueryStore keeps queries as parallel arrays of kinds,
+good IDs and IDs of distinct quantities (arrays of numeral IDs) instead
+of a tuple of separate str objects for every line, and InternedCatalog
+keeps Roman digits and unit prices in lists indexed by symbol ID, so
+answering a query takes list indexing instead of hashing of the names.
+"""
+
+from array import array
+
+from main import (IntergalacticConverter, QueryLine, answer_query,
+                  format_credits, roman_to_int)
+
+
+class SymbolTable:
+    """Bidirectional mapping name <-> small integer ID; IDs are
+    given in order of interning, starting from 0."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __len__(self):
+        return(len(self.names))
+
+    def intern(self, name):
+        """Returns ID of the name, adding the name if it is new."""
+
+        symbol_id = self.ids.get(name)
+        if symbol_id is None:
+            symbol_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return(symbol_id)
+
+    def lookup(self, name):
+        """Returns ID of the name, or None if the name is not interned."""
+
+        return(self.ids.get(name))
+
+
+class QueryStore:
+    """Column store of QueryLine records: kind codes (bytearray), good IDs
+    (array of "i", -1 if no good) and quantity IDs (array of "I") of the
+    queries. Every distinct quantity is kept once, as numeral IDs in array
+    of "H" (widened to "I" beyond 65536 symbols) with offsets. Records
+    are rebuilt on indexing and iteration."""
+
+    def __init__(self, symbols=None):
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.kinds = SymbolTable()
+        self.kind_codes = bytearray()
+        self.goods = array("i")
+        self.quantities = array("I")
+        # {tuple of numerals: quantity ID} of the distinct quantities:
+        self.quantity_ids = {}
+        self.quantity_offsets = array("I", [0])
+        self.quantity_tokens = array("H")
+
+    def __len__(self):
+        return(len(self.kind_codes))
+
+    def _add_quantity(self, quantity):
+        """Returns ID of new quantity (tuple of numerals)."""
+
+        intern = self.symbols.intern
+        numeral_ids = [intern(x) for x in quantity]
+        if len(self.symbols) > 0x10000 and \
+           self.quantity_tokens.typecode == "H":
+            self.quantity_tokens = array("I", self.quantity_tokens)
+        self.quantity_tokens.extend(numeral_ids)
+        self.quantity_offsets.append(len(self.quantity_tokens))
+        quantity_id = self.quantity_ids[quantity] = \
+            len(self.quantity_offsets) - 2
+        return(quantity_id)
+
+    def append(self, query):
+        """Add QueryLine record."""
+
+        quantity_id = self.quantity_ids.get(query.quantity)
+        if quantity_id is None:
+            quantity_id = self._add_quantity(query.quantity)
+        self.quantities.append(quantity_id)
+        self.kind_codes.append(self.kinds.intern(query.kind))
+        self.goods.append(-1 if query.good is None
+                          else self.symbols.intern(query.good))
+
+    def extend(self, queries):
+        """Add QueryLine records."""
+
+        for query in queries:
+            self.append(query)
+
+    def numeral_ids(self, quantity_id):
+        """Returns numeral IDs of the quantity."""
+
+        return(self.quantity_tokens[self.quantity_offsets[quantity_id]:
+                                    self.quantity_offsets[quantity_id + 1]])
+
+    def __getitem__(self, index):
+        names = self.symbols.names
+        good = self.goods[index]
+        return(QueryLine(self.kinds.names[self.kind_codes[index]],
+                         tuple(names[x] for x in
+                               self.numeral_ids(self.quantities[index])),
+                         None if good < 0 else names[good]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class InternedCatalog:
+    """Intergalactic -> Roman dictionary and unit prices of goods
+    as lists indexed by IDs of the symbol table: Roman digit of every
+    symbol ("" if the symbol is not a numeral) and numerator and
+    denominator of unit price (None if the symbol is not a good).
+    The dictionary and prices should not be modified after creation."""
+
+    def __init__(self, intergal_roman_dict, goods_prices, symbols):
+        self.intergal_roman_dict = intergal_roman_dict
+        self.goods_prices = goods_prices
+        self.symbols = symbols
+        self.converter = IntergalacticConverter(intergal_roman_dict)
+        self.roman_digits = []
+        self.price_numerators = []
+        self.price_denominators = []
+        intern = symbols.intern
+        for numeral in intergal_roman_dict:
+            intern(numeral)
+        for good in goods_prices:
+            intern(good)
+        self.update()
+
+    def update(self):
+        """Extend the lists to the symbols interned since the last
+        update (e.g. by QueryStore sharing the symbol table)."""
+
+        no_price = (None, None)
+        for name in self.symbols.names[len(self.roman_digits):]:
+            self.roman_digits.append(self.intergal_roman_dict.get(name, ""))
+            numerator, denominator = self.goods_prices.get(name, no_price)
+            self.price_numerators.append(numerator)
+            self.price_denominators.append(denominator)
+
+    def to_int(self, numeral_ids):
+        """Returns integer value of the quantity given as numeral IDs,
+        or None if it is not a valid Intergalactic number."""
+
+        if not numeral_ids:  # empty number, same as in intergalactic_to_int
+            return(0)
+        roman_digits = self.roman_digits
+        input_roman = "".join([roman_digits[x] for x in numeral_ids])
+        if len(input_roman) != len(numeral_ids):  # unknown numeral
+            return(None)
+        return(roman_to_int(input_roman))
+
+
+def run_interned_queries(query_store, catalog):
+    """Same as run_queries for queries of QueryStore, answered with
+    InternedCatalog sharing the symbol table of the store. Every distinct
+    quantity is converted once; number conversion and price queries are
+    answered by indexing of lists by IDs, other kinds by answer_query."""
+
+    catalog.update()
+    names = query_store.symbols.names
+    quantity_texts = []
+    quantity_values = []
+    for quantity_id in range(len(query_store.quantity_offsets) - 1):
+        numeral_ids = query_store.numeral_ids(quantity_id)
+        quantity_texts.append(" ".join([names[x] for x in numeral_ids]))
+        quantity_values.append(catalog.to_int(numeral_ids))
+
+    kind_names = query_store.kinds.names
+    goods = query_store.goods
+    quantities = query_store.quantities
+    price_numerators = catalog.price_numerators
+    price_denominators = catalog.price_denominators
+
+    out_txt = []
+    for (index, kind_code) in enumerate(query_store.kind_codes):
+        kind = kind_names[kind_code]
+        if kind != "number" and kind != "price":
+            out_txt.append(answer_query(query_store[index],
+                                        catalog.goods_prices,
+                                        catalog.converter))
+            continue
+
+        quantity_id = quantities[index]
+        if kind == "price":
+            good = goods[index]
+            if price_numerators[good] is None:
+                out_txt.append("No correct price found in input for good "
+                               "\'{0}\'".format(names[good].capitalize()))
+                continue
+
+        quantity_int = quantity_values[quantity_id]
+        if quantity_int is None:
+            out_txt.append("Invalid Intergalactic number \'{0}\' found in "
+                           "the query".format(quantity_texts[quantity_id]))
+        elif kind == "number":
+            out_txt.append(quantity_texts[quantity_id] + " is " +
+                           str(quantity_int))
+        else:
+            out_txt.append(quantity_texts[quantity_id] + " " +
+                           names[good].capitalize() + " is " +
+                           format_credits((price_numerators[good],
+                                           price_denominators[good]),
+                                          quantity_int) + " Credits")
+    return(out_txt)
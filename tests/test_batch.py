@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+
+import pytest
+from testfixtures import TempDirectory
+
+import batch
+from batch import expand_workdirs, run_batch, summarize
+from main import main
+
+sample_input = ("glob is I\n"
+                "prok is V\n"
+                "glob glob Silver is 34 Credits\n"
+                "how many Credits is glob prok Silver ?")
+contradicting_input = ("glob is I\n"
+                       "glob Silver is 17 Credits\n"
+                       "glob glob Silver is 30 Credits\n"
+                       "how many Credits is glob Silver ?")
+
+
+def test_run_batch():
+    with TempDirectory() as d:
+        d.write("a/input.txt", sample_input, encoding="utf-8")
+        d.write("b/input.txt", contradicting_input, encoding="utf-8")
+        d.write("c/input.txt", sample_input, encoding="utf-8")
+        d.makedir("empty")
+        workdirs = expand_workdirs([os.path.join(d.path, "*")])
+        assert [os.path.basename(x) for x in workdirs] == ["a", "b", "c"]
+
+        for workers in (1, 2):
+            results = run_batch(workdirs, workers=workers)
+            assert [x.status for x in results] == ["ok", "failed", "ok"]
+            assert results[1].message == \
+                "Contradicting entries in input prices!"
+            for name in ("a", "c"):
+                assert d.read(name + "/output.txt", encoding="utf-8") == \
+                    "glob prok Silver is 68 Credits"
+
+        summary = summarize(results, 1.0)
+        assert (summary["jobs"], summary["ok"], summary["failed"]) == \
+            (3, 2, 1)
+        assert summary["failures"] == [
+            {"workdir": workdirs[1],
+             "message": "Contradicting entries in input prices!"}]
+
+
+def crashing_main(workdir, **main_kwargs):
+    """main killing its worker process for workdirs named "crash"."""
+
+    if os.path.basename(workdir) == "crash":
+        os._exit(1)
+    return(main(workdir, **main_kwargs))
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="workers should inherit the patched main")
+def test_run_batch_dead_worker(monkeypatch):
+    monkeypatch.setattr(batch, "main", crashing_main)
+    with TempDirectory() as d:
+        names = ["a", "b", "crash", "c", "d", "e", "f", "g"]
+        for name in names:
+            d.write(name + "/input.txt", sample_input, encoding="utf-8")
+        workdirs = [os.path.join(d.path, x) for x in names]
+
+        results = run_batch(workdirs, workers=4)
+        assert [x.workdir for x in results] == workdirs
+        assert [x.status for x in results] == \
+            ["failed" if x == "crash" else "ok" for x in names]
+        assert results[2].message.startswith("BrokenProcessPool")
+        for name in names:
+            if name != "crash":
+                assert d.read(name + "/output.txt", encoding="utf-8") == \
+                    "glob prok Silver is 68 Credits"
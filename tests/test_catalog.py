@@ -0,0 +1,128 @@
+import pytest
+
+from catalog import (Catalog, CatalogRegistry, UpdateResult,
+                     converter_cache_entry_size)
+from main import format_rejected
+
+
+def test_add_numeral():
+    catalog = Catalog()
+
+    assert catalog.add_numeral("glob", "I").status == "added"
+    assert catalog.add_numeral("Glob", "i").status == "unchanged"
+    assert catalog.add_numeral("glob", "v") == UpdateResult(
+        "conflict", "numeral 'glob' is already defined as 'i'")
+    assert catalog.add_numeral("prok", "z").status == "rejected"
+    assert catalog.intergal_roman_dict == {"glob": "i"}
+
+
+def test_add_price():
+    catalog = Catalog()
+    catalog.add_numeral("glob", "i")
+    catalog.add_numeral("prok", "v")
+
+    assert catalog.add_price(["glob", "glob"], "Silver", "34").status == \
+        "added"
+    assert catalog.add_price(["prok"], "silver", "85").status == "unchanged"
+    assert catalog.add_price(["prok"], "silver", "86").status == "conflict"
+    assert catalog.add_price(["mish"], "gold", "10") == UpdateResult(
+        "rejected", "mish gold is 10 credits REJECTED by validate_price: "
+        "incorrect Intergalactic quantity 'mish' in validate_price")
+    assert catalog.add_price(["glob"], "gold", "-1").status == "rejected"
+    assert catalog.add_price(["glob"], "gold", "1e100000000").status == \
+        "rejected"
+    assert catalog.add_price(["prok"], "silver", "86") == UpdateResult(
+        "conflict", "unit price of 'silver' is already 17, not 17.2000")
+    assert catalog.goods_prices == {"silver": (17, 1)}
+
+
+def test_remove():
+    catalog = Catalog()
+    catalog.add_numeral("glob", "i")
+    catalog.add_numeral("prok", "v")
+    catalog.add_price(["prok"], "glob", "10")
+    assert catalog.converter.to_int(["glob", "prok"]) == 4
+
+    assert catalog.remove("glob") == UpdateResult(
+        "removed", "numeral and good 'glob' removed")
+    assert catalog.remove("glob").status == "not_found"
+    assert ("glob", "prok") not in catalog.converter.cache
+    assert ("prok",) in catalog.converter.cache
+
+    # the numeral can be redefined after removal:
+    assert catalog.add_numeral("glob", "x").status == "added"
+    assert catalog.converter.to_int(["glob", "prok"]) == 15
+
+
+def test_run_queries_invalidation():
+    catalog = Catalog()
+    catalog.add_numeral("glob", "i")
+    sample_input = [["how", "much", "is", "glob", "prok", "?"],
+                    ["how", "many", "credits", "is", "glob", "iron", "?"]]
+
+    assert catalog.run_queries(sample_input) == [
+        "Invalid Intergalactic number 'glob prok' found in the query",
+        "No correct price found in input for good 'Iron'"]
+
+    catalog.add_numeral("prok", "v")
+    catalog.add_price(["glob"], "iron", "10")
+    assert catalog.run_queries(sample_input) == [
+        "glob prok is 4", "glob Iron is 10 Credits"]
+
+    catalog.remove("prok")
+    assert catalog.run_queries(sample_input)[0] == \
+        "Invalid Intergalactic number 'glob prok' found in the query"
+    assert catalog.answer_cache.hits == 1  # the price query is cached
+
+
+def test_catalog_registry():
+    definitions = {"a": ["glob is I", "prok is V", "glob Silver is 17 Credits"],
+                   "b": ["prok is V", "glob is I", "glob Silver is 17 Credits",
+                         "hello"],
+                   "c": ["glob is X", "glob Silver is 170 Credits"]}
+    loads = []
+
+    def loader(tenant_id):
+        loads.append(tenant_id)
+        return(definitions[tenant_id])
+
+    registry = CatalogRegistry(loader=loader)
+    assert registry.register_lines("a", definitions["a"]) == []
+    assert [format_rejected(x) for x in
+            registry.register_lines("b", definitions["b"])] == \
+        ["hello REJECTED by sort_lines"]
+    registry.register_lines("c", definitions["c"])
+
+    # a and b share the dictionary, its converter and the price table:
+    assert registry.stats()["dictionaries"] == 2
+    assert registry.stats()["price_tables"] == 1
+    assert registry.tables("a")[2] is registry.tables("b")[2]
+
+    query = [["how", "many", "credits", "is", "glob", "prok", "silver", "?"]]
+    assert registry.run_queries("a", query) == \
+        ["glob prok Silver is 68 Credits"]
+    assert registry.run_queries("c", query) == \
+        ["Invalid Intergalactic number 'glob prok' found in the query"]
+
+    # running memory usage is the sum over the shared tables and caches:
+    assert registry.memory_usage() == \
+        sum(x[2] + len(x[1].cache) * converter_cache_entry_size
+            for x in registry.dictionaries.values()) + \
+        sum(x[1] for x in registry.price_tables.values())
+
+    # budget for about one tenant: least recently used ones are evicted
+    # and compiled again by the loader when they are queried:
+    registry.memory_budget = registry.memory_usage() // 2
+    registry.evict()
+    assert list(registry.tenants) == ["c"]
+    assert registry.run_queries("a", query) == \
+        ["glob prok Silver is 68 Credits"]
+    assert list(registry.tenants) == ["a"]
+    assert loads == ["a"]
+    registry.remove("a")
+    assert registry.memory_usage() == 0
+
+    with pytest.raises(ValueError):
+        registry.register_lines("d", ["glob is I", "glob is V"])
+    with pytest.raises(KeyError):
+        CatalogRegistry().run_queries("x", query)
@@ -0,0 +1,113 @@
+import asyncio
+import os
+
+from testfixtures import TempDirectory
+
+from ingest import (Ingestor, file_source, ingest_to_files, stream_source,
+                    unix_source)
+
+
+async def list_source(lines, delay=0.0):
+    for line in lines:
+        await asyncio.sleep(delay)
+        yield line
+
+
+async def failing_source():
+    yield "how much is glob ?"
+    raise ConnectionError("source closed")
+
+
+def test_ingest_definitions_before_queries():
+    results = []
+
+    def emit(source_index, line_number, file_name, text):
+        results.append((source_index, line_number, file_name, text))
+
+    # queries come before the definitions from the slow source:
+    queries = ["how much is glob prok ?",
+               "how many Credits is glob Silver ?",
+               "how much wood ?",
+               "how much is glob ffg ?"]
+    definitions = ["glob is I", "prok is V", "glob Silver is 17 Credits",
+                   "hello"]
+    ingestor = Ingestor(queue_size=2)
+    asyncio.run(ingestor.ingest([list_source(queries),
+                                 list_source(definitions, 0.01),
+                                 failing_source()], emit))
+
+    assert sorted(results) == [
+        (0, 1, "output.txt", "glob prok is 4"),
+        (0, 2, "output.txt", "glob Silver is 17 Credits"),
+        (0, 3, "output.txt", "I have no idea what you are talking about"),
+        (0, 4, "output.txt",
+         "Invalid Intergalactic number 'glob ffg' found in the query"),
+        (1, 4, "errors.txt", "hello REJECTED by sort_lines"),
+        (2, 1, "output.txt", "glob is 1")]
+    # the unknown numeral waits until all the sources are exhausted:
+    assert results[-1][:2] == (0, 4)
+    assert [(i, str(x)) for (i, x) in ingestor.source_errors] == \
+        [(2, "source closed")]
+
+
+def test_ingest_to_files():
+    async def run(d):
+        async def handle_client(reader, writer):
+            writer.write(b"how much is glob glob ?\n")
+            await writer.drain()
+            writer.close()
+
+        socket_path = os.path.join(d.path, "feed.sock")
+        server = await asyncio.start_unix_server(handle_client,
+                                                 path=socket_path)
+        await ingest_to_files([file_source(os.path.join(d.path, "in.txt")),
+                               unix_source(socket_path)], d.path)
+        server.close()
+        await server.wait_closed()
+
+    with TempDirectory() as d:
+        d.write("in.txt", "glob is I\nhello\n", encoding="utf-8")
+        asyncio.run(run(d))
+        assert d.read("output.txt", encoding="utf-8") == "glob glob is 2"
+        assert d.read("errors.txt", encoding="utf-8") == \
+            "hello REJECTED by sort_lines\n\n"
+
+
+def test_stream_source_long_line():
+    async def run():
+        reader = asyncio.StreamReader(limit=100)
+        reader.feed_data(b"glob is I\n" + b"x" * 1000 + b"\nhow much is "
+                         b"glob ?\n" + b"y" * 1000)
+        reader.feed_eof()
+        return([x async for x in stream_source(reader)])
+
+    assert asyncio.run(run()) == ["glob is I\n", None, "how much is glob ?\n",
+                                  None]
+
+    results = []
+    Ingestor().process(0, 2, None, lambda *x: results.append(x))
+    assert results == [(0, 2, "errors.txt",
+                        "REJECTED: line longer than the stream limit")]
+
+
+def test_ingest_parked_price_lines():
+    results = []
+
+    def emit(source_index, line_number, file_name, text):
+        results.append((source_index, line_number, file_name, text))
+
+    # price line and "say" query arrive before the numerals they need:
+    ingestor = Ingestor()
+    asyncio.run(ingestor.ingest([
+        list_source(["glob is I", "prok is V"], 0.02),
+        list_source(["glob Silver is 17 Credits", "how do i say 4 ?",
+                     "how many Credits is glob Silver ?",
+                     "mish Gold is 1 Credits"])], emit))
+
+    assert sorted(results) == [
+        (1, 2, "output.txt", "4 is glob prok"),
+        (1, 3, "output.txt", "glob Silver is 17 Credits"),
+        (1, 4, "errors.txt", "mish gold is 1 credits REJECTED by "
+         "validate_price: incorrect Intergalactic quantity 'mish' in "
+         "validate_price")]
+    assert ingestor.goods_prices == {"silver": (17, 1)}
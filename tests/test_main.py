@@ -1,3 +1,7 @@
+import gc
+import gzip
+import json
+
 import pytest
 from testfixtures import TempDirectory
 
@@ -293,3 +297,756 @@ def test_app_sample():
         result = d.read("output.txt", encoding="utf-8")
         assert result == sample_output
 
+
+
+def test_run_cli():
+    sample_input = ("glob is I\n"
+                    "glob glob Silver is 34 Credits\n"
+                    "how many Credits is glob Silver ?\n"
+                    "nonsense line\n")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        assert run_cli([d.path]) == 0  # working directory only
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob Silver is 17 Credits"
+        assert run_cli([d.path, "--errors-format", "counts"]) == 0
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob Silver is 17 Credits"
+        assert d.read("errors.txt", encoding="utf-8") == \
+            '{"unrecognized": 1}\n'
+
+
+def test_roman_tables():
+    roman_to_int_table, int_to_roman_table = get_roman_tables()
+    assert len(roman_to_int_table) == 3999
+    assert roman_to_int_table["mcmxliv"] == 1944
+    assert int_to_roman_table[1944] == "mcmxliv"
+    assert "iiii" not in roman_to_int_table
+
+
+@pytest.mark.parametrize("tables_loaded", [False, True])
+def test_roman_to_int(monkeypatch, tables_loaded):
+    # numerals are decoded by the grammar until the tables are loaded:
+    import main as main_module
+    int_to_roman_table = get_roman_tables()[1]
+    if not tables_loaded:
+        monkeypatch.setattr(main_module, "_roman_tables", None)
+        monkeypatch.setattr(main_module, "ROMAN_DECODE_LIMIT", 10 ** 6)
+    for (number, roman) in int_to_roman_table.items():
+        assert roman_to_int(roman) == number
+    for roman in ("iiii", "ic", "vv", "mmmm", "xm", "ivi", "z"):
+        assert roman_to_int(roman) is None
+    assert (main_module._roman_tables is not None) == tables_loaded
+
+
+def test_intergalactic_converter():
+    sample_dict = {"glob": "i", "prok": "v",  "pish": "x", "tegj": "l",
+                   "fish": "x", "gaa": "m", "c": "c"}
+
+    sample_input_list = [["glob", "prok"], ["pish", "fish"], ["gaa", "c"],
+                         ["tegj", "glob"],
+                         ["gaa", "c", "gaa", "glob", "glob", "glob"],
+                         ["gaa", "tegj"], []]
+    converter = IntergalacticConverter(sample_dict)
+
+    result = [converter.to_int(x) for x in sample_input_list]
+    assert result == [intergalactic_to_int(x, sample_dict)
+                      for x in sample_input_list]
+    assert converter.cache[("glob", "prok")] == 4
+
+    with pytest.raises(ValueError, match="1:3999 range"):
+        converter.to_int(["glob", "glob", "glob", "glob"])
+    with pytest.raises(ValueError, match="'mmm' not found"):
+        converter.to_int(["glob", "mmm"])
+
+    # only the cached numbers containing the numeral are dropped:
+    converter.invalidate("c")
+    assert ("gaa", "c") not in converter.cache
+    assert ("glob", "prok") in converter.cache
+    assert "c" not in converter.keys_by_numeral
+    assert ("gaa", "c") not in converter.keys_by_numeral["gaa"]
+    converter.invalidate()
+    assert not converter.cache and converter.keys_by_numeral is None
+
+
+def test_process_stream():
+    sample_lines = ["glob is I\n",
+                    "how much is glob glob ?\n",
+                    "how many Credits is glob Silver ?\n",
+                    "glob glob Silver is 34 Credits\n",
+                    "\n",
+                    "how many Credits is glob Silver ?\n",
+                    "prok is Z\n",
+                    "prok Gold is 10 Credits\n",
+                    "how much is glob ! \n"]
+
+    desired_result = [
+        ("output.txt", "glob glob is 2"),
+        ("output.txt", "No correct price found in input for good 'Silver'"),
+        ("output.txt", "glob Silver is 17 Credits"),
+        ("errors.txt", "prok is z REJECTED by validate_dict"),
+        ("errors.txt", "prok gold is 10 credits REJECTED by validate_price: "
+                       "incorrect Intergalactic quantity 'prok' in "
+                       "validate_price"),
+        ("errors.txt", "how much is glob ! REJECTED by sort_lines")]
+
+    result = list(process_stream(sample_lines))
+    assert result == desired_result
+
+    with pytest.raises(SystemExit):
+        list(process_stream(["glob is I", "glob is V"]))
+
+
+def test_app_sample_stream():
+    sample_input = ("glob is I\n"
+                    "prok is V\n"
+                    "pish is X\n"
+                    "tegj is L\n"
+                    "MMM  is M\n"
+                    "glob glob Silver is 34 Credits\n"
+                    "glob prok Gold is 57800 Credits\n"
+                    "pish pish Iron is 3910 Credits\n"
+                    "pish fish Iron is 3910 Credits\n"
+                    "how much is pish tegj glob glob ?\n"
+                    "how many Credits is glob prok Silver ?\n"
+                    "how much wood could a woodchuck chuck if a woodchuck "
+                    "could chuck wood ?\n"
+                    "how many credits is MMM tegj gold ?\n"
+                    "how many Credits is glob glob mud ?")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        main(d.path)
+        batch_output = d.read("output.txt", encoding="utf-8")
+        batch_errors = d.read("errors.txt", encoding="utf-8")
+        main(d.path, stream=True)
+        assert d.read("output.txt", encoding="utf-8") == batch_output
+        assert d.read("errors.txt", encoding="utf-8") == batch_errors
+
+
+def test_run_queries_parallel():
+    sample_dict = {"glob": "i", "prok": "v",  "pish": "x", "tegj": "l"}
+    sample_prices = {"silver": 17.0, "iron": 195.5}
+
+    sample_input = [
+        ["how", "much", "is", "pish", "tegj", "glob", "glob", "?"],
+        ["how", "many", "credits", "is", "glob", "prok", "silver", "?"],
+        ["how", "many", "credits", "is", "glob", "prok", "iron", "?"],
+        ["how", "much", "is", "the", "fish", "?"],
+        ["how", "many", "credits", "is", "pish", "prok", "qwerty", "?"],
+        ["how", "much", "wood", "?"]] * 5
+
+    desired_result = run_queries(sample_input, sample_dict, sample_prices)
+    result = run_queries_parallel(sample_input, sample_dict, sample_prices,
+                                  workers=3, chunk_size=4)
+    assert result == desired_result
+
+    with pytest.raises(ValueError):
+        run_queries_parallel(sample_input, sample_dict, sample_prices,
+                             chunk_size=0)
+
+
+def test_catalog():
+    sample_dict = {"glob": "i", "prok": "v"}
+    sample_prices = {"silver": 17.0, "gold": 1 / 3}
+    sample_rejected = [Rejected(("prok", "is", "z"), REJECT_ROMAN, (), 2)]
+    key = catalog_key([["glob", "is", "i"]], [])
+
+    with TempDirectory() as d:
+        path = os.path.join(d.path, "catalog.bin")
+        assert load_catalog(path, key) is None
+        save_catalog(path, key, sample_dict, sample_prices, sample_rejected)
+
+        result = load_catalog(path, key)
+        assert result == (sample_dict, sample_prices, sample_rejected)
+        assert load_catalog(path, catalog_key([["glob", "is", "v"]], [])) \
+            is None
+
+
+def test_app_catalog():
+    sample_input = ("glob is I\n"
+                    "prok is Z\n"
+                    "glob glob Silver is 34 Credits\n"
+                    "how many Credits is glob Silver ?\n"
+                    "nonsense line\n")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        main(d.path)
+        desired_output = d.read("output.txt", encoding="utf-8")
+        desired_errors = d.read("errors.txt", encoding="utf-8")
+
+        main(d.path, catalog="catalog.bin")  # compile the catalog
+        assert d.read("output.txt", encoding="utf-8") == desired_output
+
+        # the definition lines did not change, tables come from the catalog:
+        path = os.path.join(d.path, "catalog.bin")
+        key = catalog_key([["glob", "is", "i"], ["prok", "is", "z"]],
+                          [["glob", "glob", "silver", "is", "34", "credits"]])
+        intergal_roman_dict, goods_prices, rejected = load_catalog(path, key)
+        save_catalog(path, key, intergal_roman_dict, {"silver": 1.5},
+                     rejected)
+        main(d.path, catalog="catalog.bin")
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob Silver is 1.5000 Credits"
+        assert d.read("errors.txt", encoding="utf-8") == desired_errors
+
+
+def test_app_catalog_moved_lines():
+    sample_input = ("glob is I\n"
+                    "prok is Z\n"
+                    "glob glob Silver is 34 Credits\n"
+                    "how many Credits is glob Silver ?\n")
+    moved_input = ("how many Credits is glob Silver ?\n"
+                   "nonsense line\n"
+                   "glob is I\n"
+                   "\n"
+                   "prok is Z\n"
+                   "glob glob Silver is 34 Credits\n")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        main(d.path, catalog="catalog.bin", errors_format="jsonl")
+        d.write("input.txt", moved_input, encoding="utf-8")
+        main(d.path, errors_format="jsonl")
+        desired_errors = d.read("errors.txt", encoding="utf-8")
+
+        # same definition lines at other positions: the catalog is used,
+        # with line numbers of the current input:
+        main(d.path, catalog="catalog.bin", errors_format="jsonl")
+        assert d.read("errors.txt", encoding="utf-8") == desired_errors
+        assert '"line":5,' in desired_errors
+
+
+def test_intergalactic_to_int_batch():
+    pytest.importorskip("numpy")
+    sample_dict = {"glob": "i", "prok": "v",  "pish": "x", "tegj": "l",
+                   "fish": "x", "gaa": "m", "c": "c"}
+
+    sample_input_list = [["glob", "prok"], ["pish", "fish"], ["gaa", "c"],
+                         ["gaa", "c", "gaa", "glob", "glob", "glob"],
+                         ["glob", "glob", "glob", "glob"],
+                         ["glob", "mmm"], ["gaa"] * 20, []]
+
+    values, valid, errors = intergalactic_to_int_batch(sample_input_list,
+                                                       sample_dict)
+    assert values.tolist() == [4, 20, 1100, 1903, 0, 0, 0, 0]
+    assert valid.tolist() == [True] * 4 + [False] * 3 + [True]
+    assert errors.tolist() == [BATCH_OK] * 4 + [
+        BATCH_INVALID_NUMBER, BATCH_UNKNOWN_NUMERAL, BATCH_INVALID_NUMBER,
+        BATCH_OK]
+
+    # all the canonical numbers are converted as by intergalactic_to_int:
+    roman_dict = {x: x for x in roman_to_arabic_digits}
+    numbers = [list(int_to_roman(x)) for x in range(1, 4000)]
+    values, valid, errors = intergalactic_to_int_batch(numbers, roman_dict)
+    assert values.tolist() == list(range(1, 4000))
+
+
+def test_intergalactic_to_int_batch_long_rows():
+    pytest.importorskip("numpy")
+    roman_dict = {x: x for x in roman_to_arabic_digits}
+    # long garbage rows do not widen the array to their length; a long
+    # row is invalid even if its first digits form a canonical number:
+    longest = list(int_to_roman(3888))
+    numbers = [["x", "l", "i", "i"]] * 100000
+    numbers[5] = ["i"] * 20000
+    numbers[6] = longest + ["i"]
+    numbers[7] = longest + ["i"] * 100 + ["unknown"]
+    numbers[8] = longest
+
+    values, valid, errors = intergalactic_to_int_batch(numbers, roman_dict)
+    assert errors[5:9].tolist() == [BATCH_INVALID_NUMBER,
+                                    BATCH_INVALID_NUMBER,
+                                    BATCH_UNKNOWN_NUMERAL, BATCH_OK]
+    assert values[5:9].tolist() == [0, 0, 0, 3888]
+    assert int(valid.sum()) == len(numbers) - 3
+    assert set(values[:5].tolist()) == {42}
+
+
+def test_classify_records():
+    sample_input = ["glob is I\n",
+                    "glob glob Silver is 34,5 Credits\n",
+                    "glob Gold is 57XX Credits\n",
+                    "\n",
+                    "how much is pish tegj ?\n",
+                    "how many Credits is glob prok Silver ?\n",
+                    "how much wood ?\n",
+                    "glob prok Cadmium !!!\n"]
+
+    desired_result = (
+        [DictLine(("glob", "is", "i"), "glob", "i", 1)],
+        [PriceLine(("glob", "glob", "silver", "is", "34,5", "credits"),
+                   ("glob", "glob"), "silver", (69, 2), 2),
+         PriceLine(("glob", "gold", "is", "57xx", "credits"),
+                   ("glob",), "gold", None, 3)],
+        [QueryLine("number", ("pish", "tegj"), None),
+         QueryLine("price", ("glob", "prok"), "silver"),
+         QueryLine("unknown", (), None)],
+        [Rejected(("glob", "prok", "cadmium", "!!!"), REJECT_UNRECOGNIZED,
+                  (), 8)])
+
+    result = classify_records(sample_input)
+    assert result == desired_result
+    assert classify_records(sample_input, disable_gc=True) == desired_result
+    query_line_numbers = []
+    classify_records(sample_input, query_line_numbers=query_line_numbers)
+    assert query_line_numbers == [5, 6, 7]
+    assert gc.isenabled()  # GC state is restored
+
+
+def test_validate_price_records():
+    sample_dict = {"glob": "i", "prok": "v",  "pish": "x", "tegj": "l",
+                   "fish": "x", "gaa": "m", "c": "c"}
+    sample_input = [["glob", "glob", "silver", "is", "34", "credits"],
+                    ["glob", "prok", "gold", "is", "578xx", "credits"],
+                    ["pish", "pish", "iron", "is", "-1", "credits"],
+                    ["mish", "yish", "wood", "is", "10", "credits"],
+                    ["fish", "fish", "wood", "is", "39,10", "credits"]]
+    price_list, unknown_list = validate_price(sample_input, [], sample_dict)
+
+    dict_records, price_records, query_records, rejected = \
+        classify_records([" ".join(x) for x in sample_input])
+    price_out, rejected = validate_price_records(
+        price_records, rejected, IntergalacticConverter(sample_dict))
+
+    assert [list(x.words) for x in price_out] == price_list
+    assert [list(x.words) + [x.reason] for x in rejected] == unknown_list
+
+    goods_prices = calculate_prices_from_records(
+        price_out, IntergalacticConverter(sample_dict))
+    assert goods_prices == {"silver": (17, 1), "wood": (391, 200)}
+
+
+def test_calculate_goods_prices_repeated_good():
+    sample_dict = {"glob": "i", "prok": "v"}
+    sample_input_list = [["glob", "glob", "silver", "is", "34", "credits"],
+                         ["glob", "prok", "gold", "is", "57800", "credits"],
+                         ["prok", "silver", "is", "85", "credits"]]
+
+    result = calculate_goods_prices(sample_input_list, sample_dict)
+    assert result == {"silver": 17.0, "gold": 14450.0}
+
+    with pytest.raises(SystemExit):
+        calculate_goods_prices(sample_input_list + [
+            ["prok", "gold", "is", "1", "credits"]], sample_dict)
+
+
+def test_answer_cache():
+    sample_dict = {"glob": "i", "prok": "v"}
+    sample_prices = {"silver": 17.0}
+    sample_input = [
+        ["how", "much", "is", "glob", "prok", "?"],
+        ["how", "many", "credits", "is", "glob", "silver", "?"],
+        ["how", "much", "is", "glob", "prok", "?"],
+        ["how", "much", "is", "prok", "?"],
+        ["how", "many", "credits", "is", "glob", "silver", "?"]]
+
+    answer_cache = AnswerCache(max_size=2)
+    result = run_queries(sample_input, sample_dict, sample_prices,
+                         answer_cache=answer_cache)
+    assert result == run_queries(sample_input, sample_dict, sample_prices)
+    assert answer_cache.stats() == {"size": 2, "max_size": 2, "hits": 1,
+                                    "misses": 4, "evictions": 2}
+
+    answer_cache.invalidate("silver")
+    assert list(answer_cache.answers) == [
+        QueryLine("number", ("prok",), None)]
+
+
+def test_answer_cache_index():
+    answer_cache = AnswerCache(max_size=3)
+    queries = [QueryLine("number", ("glob", "glob"), None),
+               QueryLine("price", ("prok",), "silver"),
+               QueryLine("say", ("42",), None),
+               QueryLine("price", ("glob",), "gold")]
+    answer_cache.put(queries[0], "answer")
+    assert answer_cache.queries_by_name is None  # not built until needed
+    answer_cache.invalidate("iron")  # builds the index
+    assert answer_cache.queries_by_name == {"glob": {queries[0]}}
+
+    for query in queries[1:]:
+        answer_cache.put(query, "answer")
+    # the first query was evicted, and removed from the index:
+    assert "glob" in answer_cache.queries_by_name
+    assert queries[0] not in answer_cache.queries_by_name["glob"]
+
+    answer_cache.invalidate("glob")  # "say" answers are dropped too
+    assert list(answer_cache.answers) == [queries[1]]
+    assert set(answer_cache.queries_by_name) == {"prok", "silver"}
+    assert not answer_cache.say_queries
+
+    answer_cache.invalidate()
+    assert not answer_cache.answers and answer_cache.queries_by_name is None
+
+
+def test_process_stream_answer_cache():
+    sample_lines = ["how much is glob ?", "glob is I", "how much is glob ?",
+                    "how many Credits is glob Iron ?",
+                    "glob Iron is 5 Credits",
+                    "how many Credits is glob Iron ?"]
+
+    answer_cache = AnswerCache()
+    result = list(process_stream(sample_lines, answer_cache))
+    assert result == list(process_stream(sample_lines))
+    assert result[1] == ("output.txt", "glob is 1")
+    assert result[3] == ("output.txt", "glob Iron is 5 Credits")
+
+
+def test_stage_stats():
+    sample_input = ("glob is I\n"
+                    "prok is Z\n"
+                    "glob glob Silver is 34 Credits\n"
+                    "glob glob Gold is 3X Credits\n"
+                    "how many Credits is glob Silver ?\n"
+                    "nonsense line\n")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        stats = StageStats()
+        main(d.path, stats=stats)
+
+    result = stats.to_dict()
+    assert list(result) == ["read_classify", "validate_dict",
+                            "create_intergal_roman_dict", "validate_price",
+                            "calculate_goods_prices", "run_queries",
+                            "write_out"]
+    assert result["read_classify"]["items"] == 6
+    assert result["read_classify"]["rejected"] == 1
+    assert result["validate_dict"]["rejected"] == 1
+    assert result["validate_price"]["rejected"] == 1
+    assert result["run_queries"]["items"] == 1
+    assert all(x["seconds"] >= 0 for x in result.values())
+
+    prometheus = stats.to_prometheus()
+    assert '# TYPE merchants_guide_stage_seconds gauge' in prometheus
+    assert 'merchants_guide_stage_rejected{stage="validate_dict"} 1' \
+        in prometheus
+
+
+def test_parse_exact_price():
+    sample_input = ["34", "39,10", "39.104", "-0", "-1.5", "1e3", "578XX",
+                    "nan", "inf"]
+    desired_result = [(34, 1), (391, 10), (4888, 125), (0, 1), (-3, 2),
+                      (1000, 1), None, None, None]
+
+    result = [parse_exact_price(x) for x in sample_input]
+    assert result == desired_result
+
+    # prices with huge exponents are rejected at once:
+    assert parse_exact_price("1e1000") == (10 ** 1000, 1)
+    assert parse_exact_price("1e-1000") == (1, 10 ** 1000)
+    for price in ["1e100000000", "1e-100000000", "1e10000000", "0e1001"]:
+        assert parse_exact_price(price) is None
+
+
+def test_app_huge_price_exponent():
+    sample_input = ("glob is I\n"
+                    "glob Silver is 1e100000000 Credits\n"
+                    "how many Credits is glob Silver ?\n")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        main(d.path)
+        assert d.read("errors.txt", encoding="utf-8") == \
+            "glob silver is 1e100000000 credits REJECTED by " \
+            "validate_price: cannot convert price to float\n\n"
+
+
+def test_format_credits():
+    assert format_credits((17, 1), 4) == "68"
+    assert format_credits((333, 5), 2) == "133.2000"
+    assert format_credits((1, 3), 3) == "1"
+    assert format_credits((1, 3), 1) == "0.3333"
+    assert format_credits((2, 3), 1) == "0.6667"
+    assert format_credits((1, 20000), 1) == "0.0001"  # half up
+    assert format_credits((3, 20000), 1) == "0.0002"
+    assert format_credits((20001, 20000), 1) == "1.0001"
+    assert format_credits((1, 10), 3) == "0.3000"
+    assert format_credits(0.1, 3) == "0.3000"
+    assert format_credits(195.5, 4) == "782"
+
+
+def test_exact_prices_contradiction():
+    # 0.1 for 1 unit and 0.3 for 3 units are the same unit price,
+    # though float division gives different results:
+    assert 0.3 / 3 != 0.1
+    sample_input = ("glob is I\n"
+                    "glob Silver is 0.1 Credits\n"
+                    "glob glob glob Silver is 0.3 Credits\n"
+                    "how many Credits is glob glob Silver ?\n")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        main(d.path)
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob glob Silver is 0.2000 Credits"
+
+
+def test_iter_input_mmap():
+    sample_input = ("glob is I\n"
+                    "glob glob Silver is 34 Credits\n"
+                    "\n"
+                    "how many Credits is glob glob Silver ?")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        assert list(iter_input_mmap(d.path)) == list(iter_input(d.path))
+        main(d.path)
+        output = d.read("output.txt", encoding="utf-8")
+        errors = d.read("errors.txt", encoding="utf-8")
+        main(d.path, mmap_input=True)
+        assert d.read("output.txt", encoding="utf-8") == output
+        assert d.read("errors.txt", encoding="utf-8") == errors
+
+        # CR and CRLF line endings are universal newlines, as in text mode:
+        for newline in ("\r", "\r\n", "\r\r\n"):
+            d.write("input.txt", sample_input.replace("\n", newline),
+                    encoding="utf-8")
+            assert list(iter_input_mmap(d.path)) == list(iter_input(d.path))
+        d.write("input.txt", b"glob is I\rhow much is glob ?\r\n\r")
+        assert list(iter_input_mmap(d.path)) == \
+            ["glob is I\n", "how much is glob ?\n", "\n"]
+
+        d.write("input.txt", "", encoding="utf-8")
+        assert list(iter_input_mmap(d.path)) == []
+
+
+def test_write_lines():
+    sample_input = ["pish tegj glob glob is 42",
+                    "glob prok Silver is 68 Credits",
+                    "I have no idea what you are talking about",
+                    "\n"]
+
+    with TempDirectory() as d:
+        for lines in ([], ["\n"], sample_input):
+            write_out(d.path, "expected.txt", lines)
+            expected = d.read("expected.txt")
+            for chunk_lines in (1, 2, 3, 4096):
+                write_lines(d.path, "output.txt", iter(lines),
+                            chunk_lines=chunk_lines)
+                assert d.read("output.txt") == expected
+
+        write_lines(d.path, "output.txt", sample_input, "gzip")
+        with gzip.open(os.path.join(d.path, "output.txt.gz"), "rb") as f:
+            assert f.read() == expected
+        with pytest.raises(ValueError):
+            write_lines(d.path, "output.txt", sample_input, "rar")
+
+
+def test_int_to_intergalactic():
+    sample_dict = {"glob": "i", "prok": "v", "pish": "x", "tegj": "l",
+                   "blob": "i"}
+    assert int_to_intergalactic(42, sample_dict) == \
+        ("pish", "tegj", "glob", "glob")
+    with pytest.raises(ValueError):
+        int_to_intergalactic(100, sample_dict)
+    with pytest.raises(ValueError):
+        int_to_intergalactic(0, sample_dict)
+
+    table = build_intergalactic_table(sample_dict)
+    converter = IntergalacticConverter(sample_dict)
+    int_to_roman_table = get_roman_tables()[1]
+    for number in range(1, 4000):
+        assert int_to_roman(number) == int_to_roman_table[number]
+        try:
+            expected = int_to_intergalactic(number, sample_dict)
+        except ValueError:
+            expected = None
+        assert table[number] == expected
+        if expected is not None:
+            assert converter.to_intergalactic(number) == expected
+            assert converter.to_int(expected) == number
+
+    sample_dict["blin"] = "c"  # table is rebuilt for the new numeral
+    assert converter.to_intergalactic(100) == ("blin",)
+
+
+def test_run_queries_say():
+    sample_dict = {"glob": "i", "prok": "v", "pish": "x", "tegj": "l"}
+    sample_input = [["how", "do", "i", "say", "44", "?"],
+                    ["how", "do", "i", "say", "100", "?"],
+                    ["how", "do", "i", "say", "1_0", "?"],
+                    ["how", "do", "i", "say", "?"]]
+    desired_result = [
+        "44 is pish tegj glob prok",
+        "Number '100' cannot be said in Intergalactic numerals",
+        "Number '1_0' cannot be said in Intergalactic numerals",
+        "I have no idea what you are talking about"]
+
+    assert run_queries(sample_input, sample_dict, {}) == desired_result
+
+    intergal_roman_dict = {}
+    goods_prices = {}
+    converter = IntergalacticConverter(intergal_roman_dict)
+    answer_cache = AnswerCache()
+    lines = ["glob is I", "how do I say 4 ?", "prok is V",
+             "how do I say 4 ?"]
+    result = [process_line(x, intergal_roman_dict, goods_prices, converter,
+                           answer_cache) for x in lines]
+    assert result == [
+        None,
+        ("output.txt", "Number '4' cannot be said in Intergalactic numerals"),
+        None, ("output.txt", "4 is glob prok")]
+
+
+def test_register_query_form(monkeypatch):
+    import copy
+    import main as main_module
+    monkeypatch.setattr(main_module, "query_trie",
+                        copy.deepcopy(main_module.query_trie))
+    monkeypatch.setattr(main_module, "query_answerers",
+                        dict(main_module.query_answerers))
+
+    def answer_roman_query(query, goods_prices, converter):
+        return(" ".join(query.quantity) + " is " +
+               int_to_roman(converter.to_int(query.quantity)).upper())
+
+    main_module.register_query_form(
+        ("how", "much", "is", "roman"), "roman",
+        lambda words, n: (words[n:-1], None), answer_roman_query)
+
+    sample_dict = {"glob": "i", "prok": "v"}
+    sample_input = [("how", "much", "is", "roman", "glob", "prok", "?"),
+                    ("how", "much", "is", "glob", "prok", "?"),
+                    ("how", "many", "credits", "is", "glob", "iron", "?"),
+                    ("how", "?")]
+    assert [parse_query(x).kind for x in sample_input] == \
+        ["roman", "number", "price", "unknown"]
+    assert run_queries(sample_input, sample_dict, {"iron": (3, 1)}) == [
+        "glob prok is IV", "glob prok is 4", "glob Iron is 3 Credits",
+        "I have no idea what you are talking about"]
+
+
+def test_roman_tables_file():
+    with TempDirectory() as d:
+        path = os.path.join(d.path, "roman_tables.bin")
+        assert load_roman_tables(path) is None
+        save_roman_tables(path)
+        assert load_roman_tables(path) == build_roman_tables()
+        d.write("roman_tables.bin", b"MGTAB\x01damaged")
+        assert load_roman_tables(path) is None
+
+
+def test_render_rejected():
+    sample_input = ("glob is I\n"
+                    "prok is Z\n"
+                    "mish Silver is 10 Credits\n"
+                    "glob Gold is -5 Credits\n"
+                    "hello\n"
+                    "how much is glob ?\n"
+                    "nonsense line")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        main(d.path)
+        assert d.read("errors.txt", encoding="utf-8") == (
+            "hello REJECTED by sort_lines\n"
+            "nonsense line REJECTED by sort_lines\n"
+            "prok is z REJECTED by validate_dict\n"
+            "mish silver is 10 credits REJECTED by validate_price: "
+            "incorrect Intergalactic quantity 'mish' in validate_price\n"
+            "glob gold is -5 credits REJECTED by validate_price: "
+            "negative price\n\n")
+
+        main(d.path, errors_format="jsonl")
+        assert [json.loads(x) for x in
+                d.read("errors.txt", encoding="utf-8").splitlines()] == [
+            {"line": 5, "code": "unrecognized", "words": "hello",
+             "args": []},
+            {"line": 7, "code": "unrecognized", "words": "nonsense line",
+             "args": []},
+            {"line": 2, "code": "invalid_roman", "words": "prok is z",
+             "args": []},
+            {"line": 3, "code": "invalid_quantity",
+             "words": "mish silver is 10 credits", "args": [["mish"]]},
+            {"line": 4, "code": "negative_price",
+             "words": "glob gold is -5 credits", "args": []}]
+
+        main(d.path, errors_format="counts")
+        assert json.loads(d.read("errors.txt", encoding="utf-8")) == \
+            {"unrecognized": 2, "invalid_roman": 1, "invalid_quantity": 1,
+             "negative_price": 1}
+
+        with pytest.raises(ValueError):
+            main(d.path, stream=True, errors_format="jsonl")
+
+
+def test_price_history():
+    history = PriceHistory()
+    history.add("silver", (17, 1), 5)
+    history.add("silver", (20, 1), 12)
+    history.add("gold", (100, 1), 8)
+    history.add("silver", (18, 1), 9)  # inserted between
+    history.reprice({"silver": (21, 1), "gold": (90, 1)})  # sequence 13
+
+    assert history.price_at("silver", 4) is None
+    assert [history.price_at("silver", x) for x in (5, 8, 9, 12, 13)] == \
+        [(17, 1), (17, 1), (18, 1), (20, 1), (21, 1)]
+    assert history.price_at("silver") == (21, 1)
+    assert history.price_at("iron") is None
+    assert history.goods_prices(8) == {"silver": (17, 1), "gold": (100, 1)}
+    assert history.goods_prices() == {"silver": (21, 1), "gold": (90, 1)}
+
+
+def test_compile_decoder():
+    sample_dict = {"glob": "i", "prok": "v", "pish": "x", "tegj": "l"}
+    decoder = compile_decoder(sample_dict)
+    assert decoder.to_int(["pish", "tegj", "glob", "glob"]) == 42
+    assert decoder.to_int(("glob", "prok")) == 4
+    assert decoder.to_int([]) == 0
+    with pytest.raises(ValueError, match="1:3999 range"):
+        decoder.to_int(["glob", "glob", "glob", "glob"])
+    with pytest.raises(ValueError, match="'mish' not found"):
+        decoder.to_int(["pish", "mish"])
+
+    sample_dict["mish"] = "c"  # added numerals are compiled on first use
+    assert decoder.to_int(["pish", "mish"]) == 90
+    sample_dict["mish"] = "m"
+    decoder.invalidate("mish")
+    assert decoder.to_int(["mish", "pish"]) == 1010
+
+    price_list = [["glob", "glob", "silver", "is", "34", "credits"],
+                  ["mish", "mish", "mish", "mish", "gold", "is", "1",
+                   "credits"]]
+    price_list, unknown_list = validate_price(price_list, [], sample_dict,
+                                              decoder)
+    assert len(price_list) == 1 and len(unknown_list) == 1
+    goods_prices = calculate_goods_prices(price_list, sample_dict, decoder)
+    assert run_queries([["how", "many", "credits", "is", "glob", "prok",
+                         "silver", "?"]], sample_dict, goods_prices,
+                       decoder) == ["glob prok Silver is 68 Credits"]
+
+    with pytest.raises(ValueError):
+        compile_decoder({"glob": "q"})
+
+
+def test_app_reprice():
+    sample_input = ("glob is I\n"
+                    "glob Silver is 17 Credits\n"
+                    "how many Credits is glob glob Silver ?\n"
+                    "glob Silver is 20 Credits\n"
+                    "how many Credits is glob glob Silver ?")
+
+    with TempDirectory() as d:
+        d.write("input.txt", sample_input, encoding="utf-8")
+        with pytest.raises(SystemExit):
+            main(d.path)
+        # queries see the price as of their line, as in streaming mode:
+        main(d.path, reprice=True)
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob glob Silver is 34 Credits\nglob glob Silver is 40 Credits"
+        main(d.path, stream=True, reprice=True)
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob glob Silver is 34 Credits\nglob glob Silver is 40 Credits"
+
+        # the price history is built again with the compiled catalog:
+        for _ in range(2):
+            main(d.path, catalog="catalog.bin", reprice=True)
+            assert d.read("output.txt", encoding="utf-8") == \
+                "glob glob Silver is 34 Credits\n" \
+                "glob glob Silver is 40 Credits"
+        main(d.path, stream=True, reprice=True)
+        assert d.read("output.txt", encoding="utf-8") == \
+            "glob glob Silver is 34 Credits\nglob glob Silver is 40 Credits"
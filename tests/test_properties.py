@@ -0,0 +1,317 @@
+"""
+Property tests with random Intergalactic dictionaries: round trips of
+all the numbers 1:3999 and cross-checks of the fast and cached conversion
+paths against the reference implementation intergalactic_to_int.
+Performance tests compare throughput of the fast paths with the
+reference implementation on the same machine; the speedups should not
+fall below half of the baselines stored in perf_baselines.json, nor
+below 1 (fast paths should not be slower than the reference).
+Run with MERCHANTS_GUIDE_UPDATE_BASELINES=1 to store new baselines.
+"""
+
+import importlib.util
+import json
+import os
+import random
+import timeit
+from fractions import Fraction
+
+import pytest
+
+from main import *
+from symbols import InternedCatalog, QueryStore, run_interned_queries
+
+baselines_path = os.path.join(os.path.dirname(__file__),
+                              "perf_baselines.json")
+
+
+def random_dict(rnd, max_synonyms=3):
+    """Returns random Intergalactic -> Roman dictionary with 1 to
+    max_synonyms numerals for every Roman symbol."""
+
+    intergal_roman_dict = {}
+    for roman in "ivxlcdm":
+        for _ in range(rnd.randint(1, max_synonyms)):
+            while True:
+                numeral = "".join(rnd.choice("abcdefghjknoprstuwyz")
+                                  for _ in range(rnd.randint(2, 6)))
+                if numeral not in intergal_roman_dict:
+                    break
+            intergal_roman_dict[numeral] = roman
+    return(intergal_roman_dict)
+
+
+def random_number(rnd, intergal_roman_dict, int_input):
+    """Returns Intergalactic number of the integer with random choice
+    of synonymous numerals."""
+
+    numerals = {}
+    for (numeral, roman) in intergal_roman_dict.items():
+        numerals.setdefault(roman, []).append(numeral)
+    return(tuple(rnd.choice(numerals[x]) for x in int_to_roman(int_input)))
+
+
+def reference_to_int(number, intergal_roman_dict):
+    """Returns result of intergalactic_to_int, or None if it fails."""
+
+    try:
+        return(intergalactic_to_int(list(number), intergal_roman_dict))
+    except ValueError:
+        return(None)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_round_trip(seed):
+    rnd = random.Random(seed)
+    intergal_roman_dict = random_dict(rnd)
+    converter = IntergalacticConverter(intergal_roman_dict)
+    decoder = compile_decoder(intergal_roman_dict)
+    roman_to_int_table = get_roman_tables()[0]
+
+    for int_input in range(1, 4000):
+        roman = int_to_roman(int_input)
+        assert roman_to_int_table[roman] == int_input
+        number = random_number(rnd, intergal_roman_dict, int_input)
+        assert intergalactic_to_int(list(number), intergal_roman_dict) == \
+            int_input
+        assert converter.to_int(number) == int_input
+        assert decoder.to_int(number) == int_input
+
+        number = converter.to_intergalactic(int_input)
+        assert "".join(intergal_roman_dict[x] for x in number) == roman
+        assert number == int_to_intergalactic(int_input, intergal_roman_dict)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_fast_paths_match_reference(seed):
+    rnd = random.Random(seed)
+    intergal_roman_dict = random_dict(rnd)
+    numerals = sorted(intergal_roman_dict) + ["unknown"]
+
+    # random sequences of numerals, mostly invalid numbers, and valid ones:
+    numbers = [tuple(rnd.choice(numerals)
+                     for _ in range(rnd.randint(1, 6)))
+               for _ in range(2000)]
+    numbers += [random_number(rnd, intergal_roman_dict, rnd.randint(1, 3999))
+                for _ in range(2000)]
+    expected = [reference_to_int(x, intergal_roman_dict) for x in numbers]
+
+    converter = IntergalacticConverter(intergal_roman_dict)
+    for _ in range(2):  # second pass is answered from the cache
+        result = []
+        for number in numbers:
+            try:
+                result.append(converter.to_int(number))
+            except ValueError:
+                result.append(None)
+        assert result == expected
+
+    decoder = compile_decoder(intergal_roman_dict)
+    result = []
+    for number in numbers:
+        try:
+            result.append(decoder.to_int(number))
+        except ValueError:
+            result.append(None)
+    assert result == expected
+
+    if importlib.util.find_spec("numpy") is not None:
+        values, valid, errors = intergalactic_to_int_batch(
+            [list(x) for x in numbers], intergal_roman_dict)
+        assert [int(x) if y else None
+                for (x, y) in zip(values, valid)] == expected
+
+    query_store = QueryStore()
+    catalog = InternedCatalog(intergal_roman_dict, {}, query_store.symbols)
+    intern = query_store.symbols.intern
+    numeral_ids = [[intern(y) for y in x] for x in numbers]
+    catalog.update()
+    assert [catalog.to_int(x) for x in numeral_ids] == expected
+
+
+def reference_roman(int_input):
+    """Returns canonical Roman numeral of the integer by greedy
+    subtraction, independently of the conversion tables."""
+
+    out = ""
+    for (value, roman) in ((1000, "m"), (900, "cm"), (500, "d"), (400, "cd"),
+                           (100, "c"), (90, "xc"), (50, "l"), (40, "xl"),
+                           (10, "x"), (9, "ix"), (5, "v"), (4, "iv"),
+                           (1, "i")):
+        while int_input >= value:
+            out += roman
+            int_input -= value
+    return(out)
+
+
+def reference_answer(words, intergal_roman_dict, goods_prices):
+    """Returns answer of the query (list of lowercase words) computed
+    as by the original run_queries, with intergalactic_to_int and exact
+    fractions, independently of the query dispatcher."""
+
+    if words[:3] == ["how", "much", "is"]:
+        quantity = words[3:-1]
+        value = reference_to_int(quantity, intergal_roman_dict)
+        if value is None:
+            return("Invalid Intergalactic number '{0}' found in the query"
+                   .format(" ".join(quantity)))
+        return(" ".join(quantity) + " is " + str(value))
+
+    if words[:4] == ["how", "many", "credits", "is"]:
+        quantity, good = words[4:-2], words[-2]
+        if good not in goods_prices:
+            return("No correct price found in input for good '{0}'"
+                   .format(good.capitalize()))
+        value = reference_to_int(quantity, intergal_roman_dict)
+        if value is None:
+            return("Invalid Intergalactic number '{0}' found in the query"
+                   .format(" ".join(quantity)))
+        total = Fraction(*goods_prices[good]) * value
+        if total.denominator == 1:
+            price_out = str(total.numerator)
+        else:  # four decimal places, rounding half up
+            scaled = int(total * 10000 + Fraction(1, 2))
+            price_out = "{0}.{1:04d}".format(*divmod(scaled, 10000))
+        return(" ".join(quantity) + " " + good.capitalize() + " is " +
+               price_out + " Credits")
+
+    if words[:4] == ["how", "do", "i", "say"] and len(words) == 6:
+        number = words[4]
+        numerals = {}
+        for (numeral, roman) in intergal_roman_dict.items():
+            numerals.setdefault(roman, numeral)  # first defined numeral
+        if number.isdigit() and 0 < int(number) < 4000 and \
+           all(x in numerals for x in reference_roman(int(number))):
+            return(number + " is " + " ".join(
+                numerals[x] for x in reference_roman(int(number))))
+        return("Number '{0}' cannot be said in Intergalactic numerals"
+               .format(number))
+
+    return("I have no idea what you are talking about")
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_query_paths_match(seed):
+    rnd = random.Random(seed)
+    intergal_roman_dict = random_dict(rnd)
+    goods_prices = {"silver": (17, 1), "gold": (28900, 3)}
+    numerals = sorted(intergal_roman_dict)
+    lines = []
+    for _ in range(3000):
+        number = " ".join(rnd.choice(numerals)
+                          for _ in range(rnd.randint(1, 4)))
+        lines.append(rnd.choice([
+            "how much is {0} ?", "how many Credits is {0} silver ?",
+            "how many Credits is {0} gold ?", "how many Credits is {0} tin ?",
+            "how do I say " + str(rnd.randint(0, 4100)) + " ?"])
+            .format(number))
+    query_records = classify_records(lines)[2]
+
+    expected = [reference_answer(x.lower().split(), intergal_roman_dict,
+                                 goods_prices) for x in lines]
+    assert run_queries([x.lower().split() for x in lines],
+                       intergal_roman_dict, goods_prices) == expected
+    assert run_queries(query_records, intergal_roman_dict,
+                       goods_prices) == expected
+    # small cache: answers come from hits, misses and after evictions
+    answer_cache = AnswerCache(max_size=50)
+    assert run_queries(query_records * 2, intergal_roman_dict,
+                       goods_prices, answer_cache=answer_cache) == \
+        expected * 2
+    assert answer_cache.hits > 0 and answer_cache.evictions > 0
+
+    query_store = QueryStore()
+    query_store.extend(query_records)
+    catalog = InternedCatalog(intergal_roman_dict, goods_prices,
+                              query_store.symbols)
+    assert run_interned_queries(query_store, catalog) == expected
+
+
+def speedup(reference, fast, number=3, repeat=5):
+    """Returns ratio of the best run times of reference and fast; the
+    runs alternate, so that both see the same load of the machine."""
+
+    reference_times = []
+    fast_times = []
+    for _ in range(repeat):
+        reference_times.append(timeit.timeit(reference, number=number))
+        fast_times.append(timeit.timeit(fast, number=number))
+    return(min(reference_times) / min(fast_times))
+
+
+def check_baseline(name, measured, floor=1.0):
+    """Fail if the measured speedup is below half of the baseline or
+    below the floor (a fast path should not be slower than the
+    reference); store the measured speedup if the baselines are being
+    updated."""
+
+    with open(baselines_path, "r", encoding="utf-8") as f:
+        baselines = json.load(f)
+    if os.environ.get("MERCHANTS_GUIDE_UPDATE_BASELINES"):
+        baselines[name] = round(measured, 1)
+        with open(baselines_path, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return
+    assert measured >= max(baselines[name] / 2, floor), \
+        "{0}: speedup {1:.1f}, baseline {2}, floor {3}".format(
+            name, measured, baselines[name], floor)
+
+
+def test_perf_converter():
+    rnd = random.Random(0)
+    intergal_roman_dict = random_dict(rnd, 1)
+    numbers = [random_number(rnd, intergal_roman_dict, rnd.randint(1, 3999))
+               for _ in range(1000)]
+    converter = IntergalacticConverter(intergal_roman_dict)
+
+    def reference():
+        for number in numbers:
+            intergalactic_to_int(number, intergal_roman_dict)
+
+    def fast():
+        for number in numbers:
+            converter.to_int(number)
+
+    check_baseline("converter_to_int", speedup(reference, fast))
+
+
+def test_perf_to_intergalactic():
+    intergal_roman_dict = random_dict(random.Random(0), 1)
+    converter = IntergalacticConverter(intergal_roman_dict)
+
+    def reference():
+        for int_input in range(1, 1001):
+            int_to_intergalactic(int_input, intergal_roman_dict)
+
+    def fast():
+        for int_input in range(1, 1001):
+            converter.to_intergalactic(int_input)
+
+    check_baseline("converter_to_intergalactic", speedup(reference, fast))
+
+
+def test_perf_interned_queries():
+    rnd = random.Random(0)
+    intergal_roman_dict = random_dict(rnd, 1)
+    goods_prices = {"silver": (17, 1)}
+    lines = ["how many Credits is {0} silver ?".format(" ".join(
+        random_number(rnd, intergal_roman_dict, rnd.randint(1, 3999))))
+        for _ in range(2000)]
+    # queries repeat quantities, as in real workloads:
+    query_records = classify_records(
+        [rnd.choice(lines) for _ in range(20000)])[2]
+    query_store = QueryStore()
+    query_store.extend(query_records)
+    catalog = InternedCatalog(intergal_roman_dict, goods_prices,
+                              query_store.symbols)
+
+    def reference():
+        run_queries(query_records, intergal_roman_dict, goods_prices)
+
+    def fast():
+        run_interned_queries(query_store, catalog)
+
+    # the interned path should be clearly faster than run_queries:
+    check_baseline("interned_run_queries",
+                   speedup(reference, fast, number=1, repeat=9), 1.2)
@@ -0,0 +1,77 @@
+import asyncio
+
+from server import QueryServer
+
+
+def test_respond():
+    query_server = QueryServer()
+    sample_input = ["glob is I",
+                    "prok is V",
+                    "",
+                    "glob glob Silver is 34 Credits",
+                    "how many Credits is glob prok Silver ?",
+                    "glob is V",
+                    "how much wood ?",
+                    "mish Iron is 10 Credits",
+                    "hello"]
+
+    desired_result = [
+        "OK", "OK", None, "OK",
+        "glob prok Silver is 68 Credits",
+        "Contradicting entries in input dictionary!",
+        "I have no idea what you are talking about",
+        "mish iron is 10 credits REJECTED by validate_price: incorrect "
+        "Intergalactic quantity 'mish' in validate_price",
+        "hello REJECTED by sort_lines"]
+
+    result = [query_server.respond(x) for x in sample_input]
+    assert result == desired_result
+    assert query_server.intergal_roman_dict == {"glob": "i", "prok": "v"}
+
+
+def test_pipelined_clients():
+    async def run():
+        server = await QueryServer().start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        # all the lines are sent before reading any response:
+        writer.write(b"glob is I\nprok is V\n"
+                     b"how much is glob prok ?\nhow much is prok ?\n")
+        await writer.drain()
+        first = [await reader.readline() for _ in range(4)]
+
+        # definitions of one client are seen by the other clients:
+        reader2, writer2 = await asyncio.open_connection("127.0.0.1", port)
+        writer2.write(b"how much is prok glob ?\n")
+        second = await reader2.readline()
+
+        for w in (writer, writer2):
+            w.close()
+        server.close()
+        await server.wait_closed()
+        return(first, second)
+
+    first, second = asyncio.run(run())
+    assert first == [b"OK\n", b"OK\n", b"glob prok is 4\n", b"prok is 5\n"]
+    assert second == b"prok glob is 6\n"
+
+
+def test_long_line():
+    async def run():
+        server = await QueryServer(line_limit=1000).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"glob is I\n" + b"x" * 70000 + b"\nhow much is glob ?\n")
+        await writer.drain()
+        result = [await reader.readline() for _ in range(3)]
+
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return(result)
+
+    assert asyncio.run(run()) == [b"OK\n",
+                                  b"REJECTED: line longer than 1000 bytes\n",
+                                  b"glob is 1\n"]
@@ -0,0 +1,38 @@
+from main import classify_records, run_queries
+from symbols import InternedCatalog, QueryStore, SymbolTable, \
+    run_interned_queries
+
+
+def test_symbol_table():
+    symbols = SymbolTable()
+    assert [symbols.intern(x) for x in ["glob", "prok", "glob"]] == [0, 1, 0]
+    assert symbols.lookup("prok") == 1
+    assert symbols.lookup("pish") is None
+    assert symbols.names == ["glob", "prok"]
+
+
+def test_run_interned_queries():
+    sample_input = ["how much is pish tegj glob glob ?",
+                    "how many Credits is glob prok Silver ?",
+                    "how many Credits is glob prok Gold ?",
+                    "how much wood could a woodchuck chuck ?",
+                    "how much is MMM MMM ?",
+                    "how many credits is glob ffg silver ?",
+                    "how many credits is glob glob mud ?",
+                    "how do I say 42 ?",
+                    "how much is ?",
+                    "how much is pish tegj glob glob ?"]
+    sample_dict = {"glob": "i", "prok": "v", "pish": "x", "tegj": "l"}
+    sample_prices = {"silver": (17, 1), "iron": (391, 2)}
+
+    query_records = classify_records(sample_input)[2]
+    query_store = QueryStore()
+    query_store.extend(query_records)
+    assert len(query_store) == len(query_records)
+    assert list(query_store) == query_records
+    assert len(query_store.quantity_ids) == 7  # distinct quantities
+
+    catalog = InternedCatalog(sample_dict, sample_prices,
+                              query_store.symbols)
+    assert run_interned_queries(query_store, catalog) == \
+        run_queries(query_records, sample_dict, sample_prices)